@@ -0,0 +1,185 @@
+import argparse
+import heapq
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import esquema
+import retencao
+from main import main
+
+# Processo contínuo de ingestão: cada fonte roda no seu próprio intervalo
+# (com jitter), sem sobrepor execuções da mesma tarefa e respeitando um
+# orçamento global de execuções por minuto. Engine do banco e sessão HTTP
+# são compartilhados pelo processo, então continuam abertos entre ciclos.
+
+
+class Tarefa:
+    def __init__(self, nome, funcao, intervalo, jitter=0.1):
+        self.nome = nome
+        self.funcao = funcao
+        self.intervalo = intervalo
+        self.jitter = jitter
+        self.rodando = False
+        self.execucoes = 0
+        self.falhas = 0
+        self.puladas = 0
+        self.tempo_total = 0.0
+        self.tempo_maximo = 0.0
+        self.ultima_duracao = None
+
+    def proximo_atraso(self):
+        return self.intervalo * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def estatisticas(self):
+        media = self.tempo_total / self.execucoes if self.execucoes else 0.0
+        return {
+            'execucoes': self.execucoes,
+            'falhas': self.falhas,
+            'puladas': self.puladas,
+            'ultima_duracao': self.ultima_duracao,
+            'duracao_media': media,
+            'duracao_maxima': self.tempo_maximo
+        }
+
+
+class Agendador:
+    def __init__(self, tarefas, execucoes_por_minuto=30, max_simultaneas=3):
+        self.tarefas = tarefas
+        self.execucoes_por_minuto = execucoes_por_minuto
+        self._fichas = float(execucoes_por_minuto)
+        self._ultima_recarga = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=max_simultaneas)
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+
+    def _consumir_ficha(self):
+        # Balde de fichas: recarrega execucoes_por_minuto fichas por minuto.
+        agora = time.monotonic()
+        self._fichas = min(
+            self.execucoes_por_minuto,
+            self._fichas + (agora - self._ultima_recarga) * self.execucoes_por_minuto / 60
+        )
+        self._ultima_recarga = agora
+        if self._fichas >= 1:
+            self._fichas -= 1
+            return True
+        return False
+
+    def _executar(self, tarefa):
+        inicio = time.perf_counter()
+        try:
+            tarefa.funcao()
+            falhou = False
+        except Exception as e:
+            print(f"[{tarefa.nome}] erro: {e}")
+            falhou = True
+        duracao = time.perf_counter() - inicio
+        with self._lock:
+            tarefa.rodando = False
+            tarefa.execucoes += 1
+            tarefa.falhas += falhou
+            tarefa.tempo_total += duracao
+            tarefa.tempo_maximo = max(tarefa.tempo_maximo, duracao)
+            tarefa.ultima_duracao = duracao
+        print(f"[{tarefa.nome}] {'falhou' if falhou else 'concluída'} em {duracao:.2f}s")
+
+    def rodar(self):
+        fila = [(time.monotonic(), indice, tarefa) for indice, tarefa in enumerate(self.tarefas)]
+        heapq.heapify(fila)
+
+        while not self._parar.is_set():
+            quando, indice, tarefa = fila[0]
+            espera = quando - time.monotonic()
+            if espera > 0:
+                self._parar.wait(min(espera, 1.0))
+                continue
+            heapq.heappop(fila)
+
+            with self._lock:
+                if tarefa.rodando:
+                    tarefa.puladas += 1
+                    print(f"[{tarefa.nome}] execução anterior ainda em andamento; pulando.")
+                    disparar = False
+                elif not self._consumir_ficha():
+                    # Sem orçamento agora: tenta de novo em alguns segundos.
+                    heapq.heappush(fila, (time.monotonic() + 5, indice, tarefa))
+                    continue
+                else:
+                    tarefa.rodando = True
+                    disparar = True
+
+            if disparar:
+                self._executor.submit(self._executar, tarefa)
+            heapq.heappush(fila, (time.monotonic() + tarefa.proximo_atraso(), indice, tarefa))
+
+        self._executor.shutdown(wait=True)
+        self.imprimir_estatisticas()
+
+    def parar(self, *_):
+        self._parar.set()
+
+    def estatisticas(self):
+        with self._lock:
+            return {tarefa.nome: tarefa.estatisticas() for tarefa in self.tarefas}
+
+    def imprimir_estatisticas(self):
+        for nome, estatisticas in self.estatisticas().items():
+            print(
+                f"{nome}: {estatisticas['execucoes']} execuções, {estatisticas['falhas']} falhas, "
+                f"{estatisticas['puladas']} puladas, média {estatisticas['duracao_media']:.2f}s, "
+                f"máximo {estatisticas['duracao_maxima']:.2f}s"
+            )
+
+
+def tarefas_padrao(intervalo_kp=60, intervalo_clima=900, intervalo_dispositivo=86400, intervalo_frota=None,
+                   intervalo_retencao=86400):
+    instancia = main()
+    conn = config.conectar()
+
+    def clima_do_dispositivo():
+        # Usa a localização já gravada; o ipinfo só é consultado pela tarefa própria.
+        local = instancia.dispositivo_local(conn)
+        if not local:
+            instancia.inserir_dados_dispositivo()
+            local = instancia.dispositivo_local(conn)
+        dados = instancia.buscar_clima(local['latitude'], local['longitude'], local['id'])
+        instancia.gravar_clima(conn, dados)
+
+    tarefas = [
+        # O intervalo do agendador já controla a frequência, e o TTL do cache HTTP
+        # (60s, com o jitter de ±10%) faria metade das execuções não consultar o NOAA.
+        Tarefa('kp', lambda: instancia.inserir_incice_kp(revalidar=True), intervalo_kp),
+        Tarefa('clima', clima_do_dispositivo, intervalo_clima),
+        Tarefa('dispositivo', instancia.inserir_dados_dispositivo, intervalo_dispositivo),
+        Tarefa('retencao', lambda: retencao.manutencao(conn), intervalo_retencao),
+    ]
+    if intervalo_frota:
+        tarefas.append(Tarefa('frota', instancia.ciclo_frota, intervalo_frota))
+    return tarefas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agendador de ingestão com intervalo por fonte.")
+    parser.add_argument('--kp', type=float, default=60, help="intervalo do índice Kp (s)")
+    parser.add_argument('--clima', type=float, default=900, help="intervalo do clima (s)")
+    parser.add_argument('--dispositivo', type=float, default=86400, help="intervalo da localização (s)")
+    parser.add_argument('--frota', type=float, default=None, help="intervalo do ciclo de clima da frota (s); desligado se omitido")
+    parser.add_argument('--retencao', type=float, default=86400, help="intervalo das partições e da retenção do Kp (s)")
+    parser.add_argument('--por-minuto', type=int, default=30, help="máximo de execuções por minuto")
+    args = parser.parse_args()
+
+    conn = config.conectar()
+    conn.criar_banco()
+    esquema.garantir_esquema(conn)
+
+    agendador = Agendador(
+        tarefas_padrao(args.kp, args.clima, args.dispositivo, args.frota, args.retencao),
+        execucoes_por_minuto=args.por_minuto
+    )
+    signal.signal(signal.SIGINT, agendador.parar)
+    signal.signal(signal.SIGTERM, agendador.parar)
+    agendador.rodar()
@@ -0,0 +1,163 @@
+from sqlalchemy import select, func, case
+from datetime import datetime, timedelta
+
+# Manutenção incremental dos resumos por hora/dia (tabelas criadas em
+# esquema.py) e escolha automática da resolução usada pelos leitores.
+
+PASSOS = {
+    'hora': timedelta(hours=1),
+    'dia': timedelta(days=1),
+}
+
+# Maior período que cada resolução atende sem ficar pesada demais para os gráficos.
+RESOLUCOES = [
+    ('bruto', timedelta(days=2)),
+    ('hora', timedelta(days=90)),
+    ('dia', None),
+]
+
+# Quanto de cada resolução do Kp fica guardado (aplicado por retencao.py);
+# None = para sempre. Períodos mais antigos são servidos pela próxima resolução.
+RETENCAO_KP = {
+    'bruto': timedelta(days=90),
+    'hora': timedelta(days=730),
+    'dia': None,
+}
+
+# Tolerância para comparar coordenadas: no MySQL as colunas Float são de
+# precisão simples, e a igualdade exata com um double nunca casa.
+TOLERANCIA_COORDENADA = 1e-4
+
+TABELAS_KP = {'bruto': 'kp_indices', 'hora': 'kp_horario', 'dia': 'kp_diario'}
+TABELAS_CLIMA = {'bruto': 'clima', 'hora': 'clima_horario', 'dia': 'clima_diario'}
+
+
+def truncar(momento, resolucao):
+    if resolucao == 'hora':
+        return momento.replace(minute=0, second=0, microsecond=0)
+    return momento.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _inicio_do_intervalo(db, coluna, resolucao):
+    formato = '%Y-%m-%d %H:00:00' if resolucao == 'hora' else '%Y-%m-%d 00:00:00'
+    if db.cria_engine().dialect.name == 'sqlite':
+        return func.strftime(formato, coluna)
+    return func.date_format(coluna, formato)
+
+
+def _para_datetime(valor):
+    return valor if isinstance(valor, datetime) else datetime.fromisoformat(valor)
+
+
+def escolher_resolucao(inicio, fim, retencao=None):
+    """
+    A resolução mais grossa que ainda é fina o bastante para o período pedido.
+    Com `retencao` ({resolucao: timedelta}), pula as que já não guardam `inicio`.
+    """
+    periodo = fim - inicio
+    agora = datetime.now()
+    for resolucao, limite in RESOLUCOES:
+        guardado = (retencao or {}).get(resolucao)
+        if guardado is not None and inicio < agora - guardado:
+            continue
+        if limite is None or periodo <= limite:
+            return resolucao
+
+
+def atualizar_rollups_kp(db, inicio, fim):
+    """Recalcula só os intervalos de kp_horario/kp_diario que contêm [inicio, fim]."""
+    tabela = db.tabela('kp_indices')
+    for resolucao, destino in (('hora', 'kp_horario'), ('dia', 'kp_diario')):
+        de = truncar(inicio, resolucao)
+        ate = truncar(fim, resolucao) + PASSOS[resolucao]
+        intervalo = _inicio_do_intervalo(db, tabela.c.time_tag, resolucao).label('time_tag')
+        query = select(
+            intervalo,
+            func.count().label('amostras'),
+            func.min(tabela.c.estimated_kp).label('min_estimated_kp'),
+            func.max(tabela.c.estimated_kp).label('max_estimated_kp'),
+            func.avg(tabela.c.estimated_kp).label('avg_estimated_kp'),
+            func.max(tabela.c.kp_index).label('max_kp_index'),
+            func.sum(case((tabela.c.kp_index >= 5, 1), else_=0)).label('minutos_tempestade')
+        ).where(tabela.c.time_tag >= de, tabela.c.time_tag < ate).group_by(intervalo)
+
+        with db.cria_engine().connect() as conn:
+            linhas = [dict(linha) for linha in conn.execute(query).mappings()]
+        for linha in linhas:
+            linha['time_tag'] = _para_datetime(linha['time_tag'])
+            linha['avg_estimated_kp'] = float(linha['avg_estimated_kp'])
+            linha['minutos_tempestade'] = int(linha['minutos_tempestade'])
+        db.upsert_dados(destino, linhas, chaves=('time_tag',))
+
+
+def atualizar_rollups_clima(db, inicio, fim):
+    """Recalcula só os intervalos de clima_horario/clima_diario que contêm [inicio, fim]."""
+    tabela = db.tabela('clima')
+    for resolucao, destino in (('hora', 'clima_horario'), ('dia', 'clima_diario')):
+        de = truncar(inicio, resolucao)
+        ate = truncar(fim, resolucao) + PASSOS[resolucao]
+        intervalo = _inicio_do_intervalo(db, tabela.c.hora, resolucao).label('hora')
+        query = select(
+            intervalo,
+            tabela.c.latitude,
+            tabela.c.longitude,
+            func.count().label('amostras'),
+            func.avg(tabela.c.temperatura).label('avg_temperatura'),
+            func.max(tabela.c.temperatura).label('max_temperatura'),
+            func.avg(tabela.c.velocidade_vent).label('avg_velocidade_vent'),
+            func.max(tabela.c.velocidade_vent).label('max_velocidade_vent')
+        ).where(tabela.c.hora >= de, tabela.c.hora < ate) \
+            .group_by(intervalo, tabela.c.latitude, tabela.c.longitude)
+
+        with db.cria_engine().connect() as conn:
+            linhas = [dict(linha) for linha in conn.execute(query).mappings()]
+        for linha in linhas:
+            linha['hora'] = _para_datetime(linha['hora'])
+            linha['avg_temperatura'] = float(linha['avg_temperatura'])
+            linha['avg_velocidade_vent'] = float(linha['avg_velocidade_vent'])
+        db.upsert_dados(destino, linhas, chaves=('hora', 'latitude', 'longitude'))
+
+
+def serie_kp(db, inicio, fim, resolucao=None):
+    """
+    Série do Kp estimado entre inicio e fim na resolução dada (ou escolhida
+    por escolher_resolucao). Retorna (resolucao, DataFrame com time_tag e estimated_kp;
+    na resolução bruta vem também kp_index).
+    """
+    resolucao = resolucao or escolher_resolucao(inicio, fim, RETENCAO_KP)
+    filtro = {'time_tag': ('between', inicio, fim)}
+    if resolucao == 'bruto':
+        df = db.selecionar_dataframe(
+            'kp_indices', filtro, colunas=['time_tag', 'estimated_kp', 'kp_index'], ordenar_por='time_tag'
+        )
+    else:
+        filtro = {'time_tag': ('between', truncar(inicio, resolucao), fim)}
+        df = db.selecionar_dataframe(
+            TABELAS_KP[resolucao], filtro, colunas=['time_tag', 'avg_estimated_kp'], ordenar_por='time_tag'
+        ).rename(columns={'avg_estimated_kp': 'estimated_kp'})
+    return resolucao, df
+
+
+def serie_clima(db, inicio, fim, resolucao=None, dispositivo=None):
+    """
+    Como serie_kp, para a temperatura: retorna (resolucao, lista de {'hora', 'temperatura'}).
+    Com `dispositivo` (linha da tabela dispositivo), só o clima dele: pelo
+    device_id nos dados brutos e pela latitude/longitude nos resumos.
+    """
+    resolucao = resolucao or escolher_resolucao(inicio, fim)
+    filtro = {'hora': ('between', inicio, fim)}
+    if resolucao == 'bruto':
+        if dispositivo is not None:
+            filtro['device_id'] = dispositivo['id']
+        registros = db.selecionar_dados('clima', filtro, colunas=['hora', 'temperatura'], ordenar_por='hora')
+    else:
+        filtro = {'hora': ('between', truncar(inicio, resolucao), fim)}
+        if dispositivo is not None:
+            for coordenada in ('latitude', 'longitude'):
+                valor = float(dispositivo[coordenada])
+                filtro[coordenada] = ('between', valor - TOLERANCIA_COORDENADA, valor + TOLERANCIA_COORDENADA)
+        registros = db.selecionar_dados(
+            TABELAS_CLIMA[resolucao], filtro, colunas=['hora', 'avg_temperatura'], ordenar_por='hora'
+        )
+        registros = [{'hora': r['hora'], 'temperatura': r['avg_temperatura']} for r in registros]
+    return resolucao, registros
@@ -0,0 +1,160 @@
+import argparse
+import os
+from datetime import datetime, timedelta
+
+import config
+import esquema
+from retencao import inicio_do_mes, proximo_mes, meses_entre
+
+# Arquivo colunar dos meses fechados: cada mês de kp_indices/clima vira um
+# Parquet comprimido em <DIRETORIO>/<tabela>/ano=AAAA/mes=MM/dados.parquet,
+# lido direto do disco (mapeado em memória) nas análises de período longo.
+# O banco continua sendo a fonte da verdade enquanto tiver as linhas: a
+# leitura usa o arquivo só para as chaves que o banco não tem mais, e uma
+# nova exportação junta o arquivo existente com o banco (o banco prevalece).
+DIRETORIO = os.path.join('dados', 'arquivo')
+COLUNAS_TEMPO = {'kp_indices': 'time_tag', 'clima': 'hora'}
+# Chave natural de cada tabela, para casar linhas do arquivo com as do banco.
+CHAVES = {'kp_indices': ['time_tag'], 'clima': ['hora', 'latitude', 'longitude']}
+COMPRESSAO = 'zstd'
+
+
+def caminho_mes(nome_tabela, mes, diretorio=None):
+    return os.path.join(diretorio or DIRETORIO, nome_tabela, f"ano={mes:%Y}", f"mes={mes:%m}", 'dados.parquet')
+
+
+def arquivados(nome_tabela, diretorio=None):
+    """Meses já arquivados da tabela, em ordem."""
+    base = os.path.join(diretorio or DIRETORIO, nome_tabela)
+    meses = []
+    if not os.path.isdir(base):
+        return meses
+    for ano in os.listdir(base):
+        if not ano.startswith('ano='):
+            continue
+        for mes in os.listdir(os.path.join(base, ano)):
+            if mes.startswith('mes=') and os.path.exists(os.path.join(base, ano, mes, 'dados.parquet')):
+                meses.append(datetime(int(ano[4:]), int(mes[4:]), 1))
+    return sorted(meses)
+
+
+def _fora_do_banco(df_arquivo, df_banco, chave):
+    """Linhas do arquivo cuja chave não está no banco."""
+    if df_arquivo.empty or df_banco.empty:
+        return df_arquivo
+    import pandas as pd
+
+    no_banco = pd.MultiIndex.from_frame(df_arquivo[chave]).isin(pd.MultiIndex.from_frame(df_banco[chave]))
+    return df_arquivo[~no_banco]
+
+
+def exportar_mes(db, nome_tabela, mes, diretorio=None):
+    """
+    Grava o mês da tabela em Parquet, ordenado pelo tempo. Se o mês já estava
+    arquivado, mantém as linhas do arquivo que o banco não tem mais e usa a
+    versão do banco para as demais. Retorna o número de linhas do arquivo.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    coluna = COLUNAS_TEMPO[nome_tabela]
+    df = db.selecionar_dataframe(
+        nome_tabela,
+        {coluna: ('between', mes, proximo_mes(mes) - timedelta(microseconds=1))},
+        ordenar_por=coluna
+    )
+    if df.empty:
+        return 0
+
+    caminho = caminho_mes(nome_tabela, mes, diretorio)
+    if os.path.exists(caminho):
+        anterior = _fora_do_banco(pq.read_table(caminho).to_pandas(), df, CHAVES[nome_tabela])
+        if not anterior.empty:
+            df = pd.concat([anterior, df], ignore_index=True).sort_values(coluna, ignore_index=True)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = caminho + '.tmp'
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), temporario, compression=COMPRESSAO)
+    os.replace(temporario, caminho)
+    print(f"{nome_tabela}: {len(df)} registros de {mes:%Y-%m} arquivados em '{caminho}'.")
+    return len(df)
+
+
+def exportar_fechados(db, nome_tabela, forcar=False, diretorio=None):
+    """Arquiva os meses anteriores ao atual que ainda não estão no arquivo (ou todos, com `forcar`)."""
+    coluna = COLUNAS_TEMPO[nome_tabela]
+    primeiro = db.selecionar_dados(nome_tabela, colunas=[coluna], ordenar_por=coluna, limite=1)
+    if not primeiro:
+        return []
+    feitos = set(arquivados(nome_tabela, diretorio))
+    exportados = []
+    for mes in meses_entre(primeiro[0][coluna], inicio_do_mes(datetime.now())):
+        if (forcar or mes not in feitos) and exportar_mes(db, nome_tabela, mes, diretorio):
+            exportados.append(mes)
+    return exportados
+
+
+def ler(nome_tabela, inicio=None, fim=None, colunas=None, diretorio=None):
+    """
+    DataFrame do arquivo entre inicio e fim (inclusive). Só os arquivos dos
+    meses do período são abertos; o filtro de tempo e a lista de colunas
+    são aplicados na leitura do Parquet.
+    """
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    coluna = COLUNAS_TEMPO[nome_tabela]
+    arquivos = [
+        caminho_mes(nome_tabela, mes, diretorio)
+        for mes in arquivados(nome_tabela, diretorio)
+        if (inicio is None or proximo_mes(mes) > inicio) and (fim is None or mes <= fim)
+    ]
+    if not arquivos:
+        return pd.DataFrame(columns=colunas or [])
+
+    filtros = []
+    if inicio is not None:
+        filtros.append((coluna, '>=', inicio))
+    if fim is not None:
+        filtros.append((coluna, '<=', fim))
+    tabela = pq.read_table(arquivos, columns=colunas, filters=filtros or None, memory_map=True)
+    return tabela.to_pandas()
+
+
+def ler_com_banco(db, nome_tabela, inicio, fim, colunas=None, diretorio=None):
+    """
+    Período completo entre inicio e fim: tudo o que o banco ainda tem, mais as
+    linhas dos meses arquivados que não estão mais no banco (meses já
+    descartados pela retenção, ou partes deles).
+    """
+    import pandas as pd
+
+    coluna = COLUNAS_TEMPO[nome_tabela]
+    chave = CHAVES[nome_tabela]
+    colunas_leitura = colunas and colunas + [c for c in chave if c not in colunas]
+
+    df_banco = db.selecionar_dataframe(
+        nome_tabela, {coluna: ('between', inicio, fim)}, colunas_leitura, ordenar_por=coluna
+    )
+    df_arquivo = _fora_do_banco(ler(nome_tabela, inicio, fim, colunas_leitura, diretorio), df_banco, chave)
+    if df_arquivo.empty:
+        df = df_banco
+    elif df_banco.empty:
+        df = df_arquivo.reset_index(drop=True)
+    else:
+        df = pd.concat([df_arquivo, df_banco], ignore_index=True).sort_values(coluna, ignore_index=True)
+    return df[colunas] if colunas else df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arquivo em Parquet dos meses fechados de kp_indices e clima.")
+    parser.add_argument('tabelas', nargs='*', default=list(COLUNAS_TEMPO), choices=list(COLUNAS_TEMPO))
+    parser.add_argument('--forcar', action='store_true', help="regrava meses já arquivados")
+    parser.add_argument('--diretorio', default=DIRETORIO)
+    args = parser.parse_args()
+
+    conn = config.conectar()
+    conn.criar_banco()
+    esquema.garantir_esquema(conn)
+    for nome_tabela in args.tabelas:
+        exportar_fechados(conn, nome_tabela, args.forcar, args.diretorio)
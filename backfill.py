@@ -0,0 +1,239 @@
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+import config
+import esquema
+import agregados
+
+# Carga de histórico a partir de arquivos (arquivos do NOAA com o índice Kp e
+# exportações históricas do Open-Meteo) nas mesmas tabelas kp_indices/clima
+# da ingestão ao vivo. Os arquivos são lidos em fluxo (exceto o JSON do
+# Open-Meteo, ver registros_clima) e gravados em lotes; cada lote atualiza os
+# resumos do seu período, e um arquivo <entrada>.checkpoint guarda quantos
+# registros já foram gravados para retomar do ponto onde parou depois de uma
+# falha. Retomar regrava no máximo o último lote: o kp_indices é gravado por
+# upsert e o clima ignora as horas que o local já tem no banco.
+
+
+def objetos_json(caminho, tamanho_bloco=1 << 20):
+    """Gera os objetos de um array JSON (ou de um arquivo JSON Lines) sem carregar o arquivo inteiro."""
+    decodificador = json.JSONDecoder()
+    with open(caminho, encoding='utf-8') as arquivo:
+        buffer = arquivo.read(tamanho_bloco)
+        fim_arquivo = not buffer
+        posicao = 0
+        while True:
+            # Separadores entre objetos: espaços, vírgulas e o colchete de abertura.
+            while posicao < len(buffer) and buffer[posicao] in ' \t\r\n,[':
+                posicao += 1
+            if posicao < len(buffer) and buffer[posicao] == ']':
+                return
+            if posicao >= len(buffer):
+                if fim_arquivo:
+                    return
+                buffer = arquivo.read(tamanho_bloco)
+                fim_arquivo = not buffer
+                posicao = 0
+                continue
+            try:
+                objeto, posicao_final = decodificador.raw_decode(buffer, posicao)
+            except json.JSONDecodeError:
+                # Objeto cortado no fim do bloco: junta o resto com o próximo bloco.
+                if fim_arquivo:
+                    raise
+                bloco = arquivo.read(tamanho_bloco)
+                fim_arquivo = not bloco
+                buffer = buffer[posicao:] + bloco
+                posicao = 0
+                continue
+            yield objeto
+            posicao = posicao_final
+
+
+def registros_kp(caminho):
+    """Registros de kp_indices de um JSON/JSONL no formato do feed do NOAA ou de um CSV com as mesmas colunas."""
+    if caminho.endswith('.csv'):
+        with open(caminho, newline='', encoding='utf-8') as arquivo:
+            origem = csv.DictReader(arquivo)
+            for linha in origem:
+                yield _formatar_kp(linha)
+    else:
+        for objeto in objetos_json(caminho):
+            yield _formatar_kp(objeto)
+
+
+def _formatar_kp(linha):
+    return {
+        'time_tag': datetime.fromisoformat(linha['time_tag']),
+        'kp_index': int(float(linha['kp_index'])),
+        'estimated_kp': float(linha['estimated_kp']),
+        'kp': str(linha['kp'])
+    }
+
+
+def _valor(colunas, *nomes):
+    for nome in nomes:
+        if nome in colunas:
+            return colunas[nome]
+    raise KeyError(nomes[0])
+
+
+def registros_clima(caminho, latitude=None, longitude=None, device_id=None):
+    """
+    Registros de clima de uma exportação horária do Open-Meteo, em JSON
+    (objeto com 'hourly') ou CSV (bloco de metadados, linha em branco e a tabela).
+    O CSV é lido em fluxo; o JSON guarda cada variável num array separado, então
+    é carregado inteiro. Para históricos longos, prefira a exportação em CSV.
+    """
+    if caminho.endswith('.csv'):
+        with open(caminho, newline='', encoding='utf-8') as arquivo:
+            leitor = csv.reader(arquivo)
+            cabecalho = next(leitor)
+            if cabecalho and cabecalho[0] == 'latitude':
+                metadados = dict(zip(cabecalho, next(leitor)))
+                latitude = latitude if latitude is not None else float(metadados['latitude'])
+                longitude = longitude if longitude is not None else float(metadados['longitude'])
+                cabecalho = next(leitor)
+                while not cabecalho:
+                    cabecalho = next(leitor)
+            # "temperature_2m (°C)" -> "temperature_2m"
+            nomes = [coluna.split(' ')[0] for coluna in cabecalho]
+            for linha in leitor:
+                if linha:
+                    yield _formatar_clima(dict(zip(nomes, linha)), latitude, longitude, device_id)
+    else:
+        with open(caminho, encoding='utf-8') as arquivo:
+            dados = json.load(arquivo)
+        latitude = latitude if latitude is not None else dados['latitude']
+        longitude = longitude if longitude is not None else dados['longitude']
+        horario = dados['hourly']
+        nomes = list(horario)
+        for valores in zip(*(horario[nome] for nome in nomes)):
+            yield _formatar_clima(dict(zip(nomes, valores)), latitude, longitude, device_id)
+
+
+def _formatar_clima(colunas, latitude, longitude, device_id):
+    return {
+        'hora': datetime.fromisoformat(colunas['time']),
+        'temperatura': float(_valor(colunas, 'temperature_2m', 'temperature')),
+        'velocidade_vent': float(_valor(colunas, 'wind_speed_10m', 'windspeed_10m', 'windspeed')),
+        'direcao_vent': float(_valor(colunas, 'wind_direction_10m', 'winddirection_10m', 'winddirection')),
+        'latitude': float(latitude),
+        'longitude': float(longitude),
+        'device_id': device_id
+    }
+
+
+def _sem_repetidos_clima(conn, lote):
+    """Registros do lote cuja hora ainda não está no banco para o mesmo local."""
+    novos = []
+    locais = {(registro['latitude'], registro['longitude']) for registro in lote}
+    for latitude, longitude in locais:
+        registros = [r for r in lote if (r['latitude'], r['longitude']) == (latitude, longitude)]
+        tolerancia = agregados.TOLERANCIA_COORDENADA
+        existentes = conn.selecionar_dados('clima', {
+            'latitude': ('between', latitude - tolerancia, latitude + tolerancia),
+            'longitude': ('between', longitude - tolerancia, longitude + tolerancia),
+            'hora': ('between', min(r['hora'] for r in registros), max(r['hora'] for r in registros))
+        }, colunas=['hora'])
+        horas = {existente['hora'] for existente in existentes}
+        novos.extend(r for r in registros if r['hora'] not in horas)
+    return novos
+
+
+def ler_checkpoint(caminho):
+    try:
+        with open(caminho + '.checkpoint', encoding='utf-8') as arquivo:
+            return json.load(arquivo)['gravados']
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def gravar_checkpoint(caminho, gravados):
+    temporario = caminho + '.checkpoint.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump({'gravados': gravados, 'atualizado_em': datetime.now().isoformat()}, arquivo)
+    os.replace(temporario, caminho + '.checkpoint')
+
+
+def carregar(conn, tipo, caminho, tamanho_lote=5000, **opcoes):
+    """Carrega o arquivo em lotes, retomando do checkpoint. Retorna o total de registros gravados nesta execução."""
+    if tipo == 'kp':
+        registros = registros_kp(caminho)
+        gravar = lambda lote: conn.upsert_dados('kp_indices', lote, chaves=('time_tag',), tamanho_lote=tamanho_lote)
+        atualizar_rollups = agregados.atualizar_rollups_kp
+        coluna_tempo = 'time_tag'
+    else:
+        registros = registros_clima(caminho, **opcoes)
+        # inserir_dados não é idempotente: sem o filtro, retomar depois de uma
+        # falha entre a gravação e o checkpoint duplicaria o último lote.
+        def gravar(lote):
+            novos = _sem_repetidos_clima(conn, lote)
+            if novos:
+                conn.inserir_dados('clima', novos)
+        atualizar_rollups = agregados.atualizar_rollups_clima
+        coluna_tempo = 'hora'
+
+    ja_gravados = ler_checkpoint(caminho)
+    if ja_gravados:
+        print(f"Retomando '{caminho}' após {ja_gravados} registros já gravados.")
+
+    posicao = 0
+    gravados = 0
+    lote = []
+    inicio = time.perf_counter()
+
+    def descarregar():
+        nonlocal gravados
+        gravar(lote)
+        # Resumos antes do checkpoint: um lote marcado como gravado já tem os resumos em dia.
+        atualizar_rollups(
+            conn,
+            min(registro[coluna_tempo] for registro in lote),
+            max(registro[coluna_tempo] for registro in lote)
+        )
+        gravados += len(lote)
+        gravar_checkpoint(caminho, ja_gravados + gravados)
+        decorrido = time.perf_counter() - inicio
+        print(f"{ja_gravados + gravados} registros gravados ({gravados / decorrido:.0f} registros/s).")
+
+    for registro in registros:
+        posicao += 1
+        if posicao <= ja_gravados:
+            continue
+        lote.append(registro)
+        if len(lote) >= tamanho_lote:
+            descarregar()
+            lote = []
+    if lote:
+        descarregar()
+
+    decorrido = time.perf_counter() - inicio
+    taxa = gravados / decorrido if decorrido > 0 else 0
+    print(f"Carga de '{caminho}' concluída: {gravados} registros em {decorrido:.1f}s ({taxa:.0f} registros/s).")
+    return gravados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga de histórico do índice Kp e do clima a partir de arquivos.")
+    parser.add_argument('tipo', choices=['kp', 'clima'])
+    parser.add_argument('arquivos', nargs='+')
+    parser.add_argument('--lote', type=int, default=5000, help="registros por lote gravado")
+    parser.add_argument('--latitude', type=float, help="latitude do clima (padrão: a do arquivo)")
+    parser.add_argument('--longitude', type=float, help="longitude do clima (padrão: a do arquivo)")
+    parser.add_argument('--device-id', type=int, help="dispositivo dono do clima carregado")
+    args = parser.parse_args()
+
+    conn = config.conectar()
+    conn.criar_banco()
+    esquema.garantir_esquema(conn)
+
+    opcoes = {}
+    if args.tipo == 'clima':
+        opcoes = {'latitude': args.latitude, 'longitude': args.longitude, 'device_id': args.device_id}
+    for caminho in args.arquivos:
+        carregar(conn, args.tipo, caminho, args.lote, **opcoes)
@@ -1,15 +1,75 @@
-from sqlalchemy import create_engine, inspect, Column, Integer, String, Float, DateTime, MetaData, Table
+from sqlalchemy import create_engine, event, inspect, text, func, select, tuple_, Integer, String, Float, DateTime, MetaData, Table
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.orm import sessionmaker
 import pymysql
+import atexit
+import os
+import esquema
+import threading
+import warnings
 from datetime import datetime
 
+# Um engine (e o seu pool de conexões) por DSN, compartilhado por todas as
+# instâncias de meusqldb do processo. As opções do pool valem por DSN: são as
+# da instância que criou o engine (config.py as lê do ambiente).
+_engines = {}
+_opcoes_engines = {}
+_engines_lock = threading.Lock()
+
+# Cache de esquema por DSN: um MetaData compartilhado com as tabelas já
+# refletidas e a lista de tabelas existentes no banco.
+_esquemas = {}
+_esquemas_lock = threading.Lock()
+
+_OPERADORES = {
+    '=': lambda coluna, valor: coluna == valor,
+    '!=': lambda coluna, valor: coluna != valor,
+    '>': lambda coluna, valor: coluna > valor,
+    '>=': lambda coluna, valor: coluna >= valor,
+    '<': lambda coluna, valor: coluna < valor,
+    '<=': lambda coluna, valor: coluna <= valor,
+    'in': lambda coluna, valores: coluna.in_(list(valores)),
+}
+
+def _condicoes(tabela, filtro):
+    condicoes = []
+    for chave, valor in filtro.items():
+        coluna = tabela.c[chave]
+        if not isinstance(valor, tuple):
+            condicoes.append(coluna == valor)
+        elif valor[0] == 'between':
+            condicoes.append(coluna.between(valor[1], valor[2]))
+        elif valor[0] in _OPERADORES:
+            condicoes.append(_OPERADORES[valor[0]](coluna, valor[1]))
+        else:
+            raise ValueError(f"Operador de filtro desconhecido: {valor[0]!r}")
+    return condicoes
+
+def _dtype_pandas(coluna):
+    if isinstance(coluna.type, DateTime):
+        return 'datetime64[ns]'
+    if isinstance(coluna.type, Float):
+        return 'float64'
+    if isinstance(coluna.type, Integer):
+        return 'Int64' if coluna.nullable else 'int64'
+    if isinstance(coluna.type, String):
+        return 'category'
+    return 'object'
+
 class meusqldb:
-    def __init__(self, user, password, host, port, db_name):
+    def __init__(self, user, password, host, port, db_name,
+                 pool_size=5, max_overflow=10, pool_pre_ping=True, pool_recycle=3600):
         self.user = user
         self.password = password
         self.host = host
         self.port = port
         self.db_name = db_name
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_pre_ping = pool_pre_ping
+        self.pool_recycle = pool_recycle
         self.DATABASE_URL = f'mysql+pymysql://{self.user}:{self.password}@{self.host}:{self.port}/{self.db_name}'
 
     def connect(self):
@@ -34,6 +94,7 @@ class meusqldb:
             cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.db_name}")
             print(f"Banco de dados '{self.db_name}' verificado/criado com sucesso.")
             cursor.close()
+            conn.close()
             return True
         except pymysql.MySQLError as err:
             print(f"Erro ao criar/verificar o banco de dados: {err}")
@@ -41,30 +102,65 @@ class meusqldb:
             return False
 
     def criar_tabela(self, engine):
-        metadata = MetaData()
-        tabela_kp = Table(
-            'kp_indices', metadata,
-            Column('id', Integer, primary_key=True, autoincrement=True),
-            Column('time_tag', DateTime, nullable=False),
-            Column('kp_index', Integer, nullable=False),
-            Column('estimated_kp', Float, nullable=False),
-            Column('kp', String(10), nullable=False)
-        )
-        metadata.create_all(engine)
+        esquema.kp_indices.create(engine, checkfirst=True)
+        self.invalidar_cache('kp_indices')
         print("Tabela 'kp_indices' criada/verificada com sucesso.")
-        return tabela_kp
+        return esquema.kp_indices
 
     def criar_tabela_generica(self, nome_tabela, colunas):
         metadata = MetaData()
         tabela = Table(nome_tabela, metadata, *colunas)
         engine = self.cria_engine()
         metadata.create_all(engine)
+        self.invalidar_cache(nome_tabela)
         print(f"Tabela '{nome_tabela}' criada/verificada com sucesso.")
         return tabela
 
+    def _esquema(self):
+        with _esquemas_lock:
+            esquema = _esquemas.get(self.DATABASE_URL)
+            if esquema is None:
+                esquema = {'metadata': MetaData(), 'tabelas': None, 'versao': None}
+                _esquemas[self.DATABASE_URL] = esquema
+            return esquema
+
+    def tabela(self, nome_tabela):
+        """Retorna o Table refletido, consultando o banco só na primeira vez."""
+        esquema = self._esquema()
+        with _esquemas_lock:
+            metadata = esquema['metadata']
+            if nome_tabela not in metadata.tables:
+                Table(nome_tabela, metadata, autoload_with=self.cria_engine())
+            return metadata.tables[nome_tabela]
+
+    def invalidar_cache(self, nome_tabela=None):
+        """Descarta o esquema em cache (de uma tabela ou de todas), p.ex. após uma migração."""
+        esquema = self._esquema()
+        with _esquemas_lock:
+            metadata = esquema['metadata']
+            if nome_tabela is None:
+                metadata.clear()
+            elif nome_tabela in metadata.tables:
+                metadata.remove(metadata.tables[nome_tabela])
+            esquema['tabelas'] = None
+
+    def sincronizar_versao_esquema(self, versao):
+        """Invalida o cache inteiro se a versão do esquema mudou desde a última chamada."""
+        esquema = self._esquema()
+        with _esquemas_lock:
+            mudou = esquema['versao'] != versao
+            esquema['versao'] = versao
+        if mudou:
+            self.invalidar_cache()
+        return mudou
+
     def verifica_tabelas(self):
-        inspector = inspect(self.cria_engine())
-        tabelas = inspector.get_table_names()
+        esquema = self._esquema()
+        with _esquemas_lock:
+            if esquema['tabelas'] is None:
+                inspector = inspect(self.cria_engine())
+                esquema['tabelas'] = inspector.get_table_names()
+            tabelas = list(esquema['tabelas'])
 
         if tabelas:
             print("Tabelas existentes no banco de dados:")
@@ -73,14 +169,64 @@ class meusqldb:
             print("Nenhuma tabela encontrada no banco de dados.")
             return []
 
+    def opcoes_pool(self):
+        return {
+            'pool_size': self.pool_size,
+            'max_overflow': self.max_overflow,
+            'pool_pre_ping': self.pool_pre_ping,
+            'pool_recycle': self.pool_recycle
+        }
+
     def cria_engine(self):
-        return create_engine(self.DATABASE_URL, echo=False)
+        with _engines_lock:
+            engine = _engines.get(self.DATABASE_URL)
+            if engine is None:
+                engine = self._novo_engine()
+                _engines[self.DATABASE_URL] = engine
+                _opcoes_engines[self.DATABASE_URL] = self.opcoes_pool()
+            elif _opcoes_engines[self.DATABASE_URL] != self.opcoes_pool():
+                warnings.warn(
+                    f"O pool de '{self.db_name}' já foi criado com {_opcoes_engines[self.DATABASE_URL]}; "
+                    f"as opções {self.opcoes_pool()} desta instância são ignoradas (feche o pool para trocá-las).",
+                    RuntimeWarning, stacklevel=2
+                )
+            return engine
+
+    def _novo_engine(self):
+        return create_engine(
+            self.DATABASE_URL,
+            echo=False,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_pre_ping=self.pool_pre_ping,
+            pool_recycle=self.pool_recycle
+        )
+
+    def fechar(self):
+        """Fecha o pool de conexões deste DSN; o próximo uso cria um novo."""
+        with _engines_lock:
+            engine = _engines.pop(self.DATABASE_URL, None)
+            _opcoes_engines.pop(self.DATABASE_URL, None)
+        with _esquemas_lock:
+            _esquemas.pop(self.DATABASE_URL, None)
+        if engine is not None:
+            engine.dispose()
+
+    @staticmethod
+    def fechar_todas():
+        """Fecha os pools de todos os DSNs abertos no processo."""
+        with _engines_lock:
+            engines = list(_engines.values())
+            _engines.clear()
+            _opcoes_engines.clear()
+        with _esquemas_lock:
+            _esquemas.clear()
+        for engine in engines:
+            engine.dispose()
 
     def inserir_dados(self, nome_tabela, dados):
         engine = self.cria_engine()
-        metadata = MetaData()
-        tabela = Table(nome_tabela, metadata, autoload_with=engine)
-        conn = self.connect()
+        tabela = self.tabela(nome_tabela)
         with engine.connect() as conn:
             conn.execute(tabela.insert(), dados)
             conn.commit()
@@ -88,42 +234,313 @@ class meusqldb:
 
     def atualizar_dados(self, nome_tabela, filtro, novos_dados):
         engine = self.cria_engine()
-        metadata = MetaData()
-        tabela = Table(nome_tabela, metadata, autoload_with=engine)
+        tabela = self.tabela(nome_tabela)
 
         with engine.connect() as conn:
-            query = tabela.update().where(
-                *(tabela.c[chave] == valor for chave, valor in filtro.items())
-            ).values(**novos_dados)
+            query = tabela.update().where(*_condicoes(tabela, filtro)).values(**novos_dados)
             resultado = conn.execute(query)
+            conn.commit()
+
+    def upsert_dados(self, nome_tabela, dados, chaves=(), tamanho_lote=500):
+        """
+        INSERT ... ON DUPLICATE KEY UPDATE em lotes, numa única transação.
+        `chaves` são as colunas da chave única, que não entram no UPDATE.
+        Registros com conjuntos de colunas diferentes são gravados em grupos
+        separados: a coluna ausente fica com o default na inserção e não é
+        alterada na atualização.
+        Retorna o total de linhas afetadas informado pelo MySQL.
+        """
+        if isinstance(dados, dict):
+            dados = [dados]
+        if not dados:
+            return 0
+
+        grupos = {}
+        for registro in dados:
+            grupos.setdefault(tuple(registro), []).append(registro)
 
-    def selecionar_dados(self, nome_tabela, filtro=None):
         engine = self.cria_engine()
-        metadata = MetaData()
-        tabela = Table(nome_tabela, metadata, autoload_with=engine)
+        tabela = self.tabela(nome_tabela)
+        afetados = 0
+        with engine.begin() as conn:
+            for colunas, registros in grupos.items():
+                atualizar = [
+                    coluna for coluna in colunas
+                    if coluna not in chaves and not tabela.c[coluna].primary_key
+                ]
+                query = self._montar_upsert(tabela, atualizar, chaves)
+                for inicio in range(0, len(registros), tamanho_lote):
+                    resultado = conn.execute(query, registros[inicio:inicio + tamanho_lote])
+                    afetados += max(resultado.rowcount, 0)
+        print(f"Upsert de {len(dados)} registros na tabela '{nome_tabela}'.")
+        return afetados
 
-        with engine.connect() as conn:
-            if filtro:
-                query = tabela.select().where(
-                    *(tabela.c[chave] == valor for chave, valor in filtro.items())
-                )
+    def _montar_upsert(self, tabela, atualizar, chaves):
+        query = mysql_insert(tabela)
+        return query.on_duplicate_key_update({coluna: query.inserted[coluna] for coluna in atualizar})
+
+    def garantir_chave_unica(self, nome_tabela, coluna):
+        """Cria a chave única em `coluna` se ainda não existir, removendo duplicatas antes."""
+        inspector = inspect(self.cria_engine())
+        for indice in inspector.get_indexes(nome_tabela):
+            if indice.get('unique') and indice['column_names'] == [coluna]:
+                return False
+
+        with self.cria_engine().begin() as conn:
+            conn.execute(text(
+                f"DELETE t1 FROM `{nome_tabela}` t1 JOIN `{nome_tabela}` t2 "
+                f"ON t1.`{coluna}` = t2.`{coluna}` AND t1.id > t2.id"
+            ))
+            conn.execute(text(
+                f"ALTER TABLE `{nome_tabela}` ADD UNIQUE KEY `uq_{nome_tabela}_{coluna}` (`{coluna}`)"
+            ))
+        self.invalidar_cache(nome_tabela)
+        print(f"Chave única em '{nome_tabela}.{coluna}' criada com sucesso.")
+        return True
+
+    def garantir_tabela_estado(self):
+        if 'ingestao_estado' not in self.verifica_tabelas():
+            esquema.ingestao_estado.create(self.cria_engine(), checkfirst=True)
+            self.invalidar_cache('ingestao_estado')
+
+    def ler_marca_dagua(self, fonte, nome_tabela=None, coluna=None):
+        """
+        Retorna a marca d'água (maior timestamp já gravado) da fonte.
+        Se ainda não houver estado salvo e `nome_tabela`/`coluna` forem dados,
+        usa MAX(coluna) da tabela como ponto de partida.
+        """
+        self.garantir_tabela_estado()
+        estado = self.selecionar_dados('ingestao_estado', {'fonte': fonte})
+        if estado and estado[0]['marca_dagua'] is not None:
+            return estado[0]['marca_dagua']
+
+        if nome_tabela and coluna and nome_tabela in self.verifica_tabelas():
+            tabela = self.tabela(nome_tabela)
+            with self.cria_engine().connect() as conn:
+                return conn.execute(select(func.max(tabela.c[coluna]))).scalar()
+        return None
+
+    def gravar_marca_dagua(self, fonte, marca_dagua):
+        self.garantir_tabela_estado()
+        self.upsert_dados('ingestao_estado', {
+            'fonte': fonte,
+            'marca_dagua': marca_dagua,
+            'atualizado_em': datetime.now()
+        }, chaves=('fonte',))
+
+    def montar_consulta(self, nome_tabela, filtro=None, colunas=None, ordenar_por=None,
+                        limite=None, deslocamento=None, apos=None):
+        """
+        Monta o SELECT usado pelos métodos de leitura.
+
+        filtro: {coluna: valor} para igualdade, ou {coluna: (operador, ...)} com
+            operador em '=', '!=', '>', '>=', '<', '<=', 'between' (dois valores) e 'in' (lista).
+        colunas: lista de colunas a retornar (padrão: todas).
+        ordenar_por: coluna ou lista de colunas; prefixo '-' ordena de forma decrescente.
+            A chave primária entra no fim como desempate, para a ordem ser estável.
+        apos: paginação por chave; tupla com os valores das colunas de ordenação
+            seguidos dos da chave primária (as que não estão em ordenar_por) da
+            última linha da página anterior. Exige todas as colunas no mesmo sentido.
+        """
+        tabela = self.tabela(nome_tabela)
+        if colunas:
+            query = select(*(tabela.c[coluna] for coluna in colunas))
+        else:
+            query = tabela.select()
+
+        if filtro:
+            query = query.where(*_condicoes(tabela, filtro))
+
+        if isinstance(ordenar_por, str):
+            ordenar_por = [ordenar_por]
+        ordenar_por = list(ordenar_por or [])
+        if ordenar_por:
+            # Desempate pela chave primária, no sentido da última coluna pedida.
+            sentido = '-' if ordenar_por[-1].startswith('-') else ''
+            ordenar_por += [
+                sentido + coluna.name for coluna in tabela.primary_key
+                if coluna.name not in {nome.lstrip('-') for nome in ordenar_por}
+            ]
+        ordenacao = []
+        for coluna in ordenar_por:
+            if coluna.startswith('-'):
+                ordenacao.append(tabela.c[coluna[1:]].desc())
             else:
-                query = tabela.select()
+                ordenacao.append(tabela.c[coluna].asc())
+        if ordenacao:
+            query = query.order_by(*ordenacao)
+
+        if apos is not None:
+            if not ordenar_por:
+                raise ValueError("Paginação com 'apos' exige 'ordenar_por'.")
+            sentidos = {coluna.startswith('-') for coluna in ordenar_por}
+            if len(sentidos) > 1:
+                raise ValueError("Paginação com 'apos' exige todas as colunas de ordenação no mesmo sentido.")
+            if not isinstance(apos, tuple):
+                apos = (apos,)
+            if len(apos) != len(ordenar_por):
+                raise ValueError(f"'apos' precisa de {len(ordenar_por)} valores: {', '.join(ordenar_por)}.")
+            chave = tuple_(*(tabela.c[coluna.lstrip('-')] for coluna in ordenar_por))
+            query = query.where(chave < tuple_(*apos) if sentidos == {True} else chave > tuple_(*apos))
+
+        if limite is not None:
+            query = query.limit(limite)
+        if deslocamento is not None:
+            query = query.offset(deslocamento)
+        return query
+
+    def selecionar_dados(self, nome_tabela, filtro=None, colunas=None, ordenar_por=None,
+                         limite=None, deslocamento=None, apos=None):
+        engine = self.cria_engine()
+        query = self.montar_consulta(nome_tabela, filtro, colunas, ordenar_por, limite, deslocamento, apos)
 
-            resultado = conn.execute(query).mappings()  
+        with engine.connect() as conn:
+            resultado = conn.execute(query).mappings()
             registros = [dict(row) for row in resultado]
             return registros
 
+    def selecionar_dados_stream(self, nome_tabela, filtro=None, colunas=None, ordenar_por=None,
+                                limite=None, tamanho_lote=1000, em_lotes=False):
+        """
+        Versão em gerador de selecionar_dados: lê por um cursor do lado do servidor
+        (SSCursor no pymysql) e entrega uma linha por vez, ou listas de até
+        `tamanho_lote` linhas se `em_lotes` for True. A memória usada não depende
+        do tamanho da tabela. A conexão fica presa até o gerador terminar ou ser fechado.
+        """
+        engine = self.cria_engine()
+        query = self.montar_consulta(nome_tabela, filtro, colunas, ordenar_por, limite)
+
+        with engine.connect() as conn:
+            resultado = conn.execution_options(
+                stream_results=True, yield_per=tamanho_lote
+            ).execute(query).mappings()
+            if em_lotes:
+                for lote in resultado.partitions():
+                    yield [dict(row) for row in lote]
+            else:
+                for row in resultado:
+                    yield dict(row)
+
+    def selecionar_dataframe(self, nome_tabela, filtro=None, colunas=None, ordenar_por=None,
+                             limite=None, tipos=None):
+        """
+        Lê direto do cursor para um DataFrame com dtypes tipados pelo esquema:
+        DateTime -> datetime64, Float -> float64, Integer -> int64 (Int64 se aceitar
+        nulo) e String -> category. `tipos` sobrescreve o dtype de colunas específicas.
+        As linhas vêm cruas do cursor do driver (sem passar pelos Row do
+        SQLAlchemy) e cada coluna é convertida de uma vez pelo pandas.
+        """
+        import pandas as pd
+
+        engine = self.cria_engine()
+        tabela = self.tabela(nome_tabela)
+        query = self.montar_consulta(nome_tabela, filtro, colunas, ordenar_por, limite)
+
+        with engine.connect() as conn:
+            resultado = conn.execute(query)
+            nomes = list(resultado.keys())
+            linhas = resultado.cursor.fetchall()
+            resultado.close()
+
+        df = pd.DataFrame.from_records(linhas, columns=nomes, coerce_float=True)
+        tipos = tipos or {}
+        for nome in nomes:
+            dtype = tipos.get(nome, _dtype_pandas(tabela.c[nome]))
+            if dtype == 'datetime64[ns]':
+                # O SQLite devolve datas como texto ISO; o MySQL, como datetime.
+                df[nome] = pd.to_datetime(df[nome], format='ISO8601').astype(dtype)
+            else:
+                df[nome] = df[nome].astype(dtype)
+        return df
+
     def deletar_dados(self, nome_tabela, filtro):
         engine = self.cria_engine()
-        metadata = MetaData()
-        tabela = Table(nome_tabela, metadata, autoload_with=engine)
+        tabela = self.tabela(nome_tabela)
 
         with engine.connect() as conn:
-            query = tabela.delete().where(
-                *(tabela.c[chave] == valor for chave, valor in filtro.items())
-            )
+            query = tabela.delete().where(*_condicoes(tabela, filtro))
             resultado = conn.execute(query)
             conn.commit()
             print(f"Dados deletados com sucesso da tabela '{nome_tabela}'.")
 
+
+class meusqlite(meusqldb):
+    """
+    Mesmo contrato de meusqldb num arquivo SQLite local, para gateways sem
+    servidor MySQL e para rodar sem serviços externos. Cada conexão liga o
+    WAL (leituras não bloqueiam a gravação) com synchronous=NORMAL.
+    """
+    def __init__(self, caminho, pool_size=5, max_overflow=10, busy_timeout=30000):
+        self.caminho = caminho
+        self.db_name = os.path.basename(caminho)
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.busy_timeout = busy_timeout
+        self.DATABASE_URL = f'sqlite:///{caminho}'
+
+    def opcoes_pool(self):
+        return {'pool_size': self.pool_size, 'max_overflow': self.max_overflow, 'busy_timeout': self.busy_timeout}
+
+    def connect(self):
+        return self.cria_engine().raw_connection()
+
+    def criar_banco(self):
+        if self.caminho != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+        self.cria_engine()
+        print(f"Banco de dados '{self.caminho}' verificado/criado com sucesso.")
+        return True
+
+    def _novo_engine(self):
+        if self.caminho == ':memory:':
+            # Um banco em memória só existe dentro da sua conexão: todos usam a mesma.
+            opcoes = {'poolclass': StaticPool}
+        else:
+            opcoes = {'pool_size': self.pool_size, 'max_overflow': self.max_overflow}
+        engine = create_engine(
+            self.DATABASE_URL,
+            echo=False,
+            connect_args={'check_same_thread': False},
+            **opcoes
+        )
+
+        @event.listens_for(engine, 'connect')
+        def _configurar_conexao(conexao, _):
+            cursor = conexao.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+            cursor.close()
+
+        return engine
+
+    def _montar_upsert(self, tabela, atualizar, chaves):
+        # O SQLite exige o alvo do conflito; sem `chaves`, é a chave primária.
+        alvo = list(chaves) or [coluna.name for coluna in tabela.primary_key]
+        query = sqlite_insert(tabela)
+        if not atualizar:
+            return query.on_conflict_do_nothing(index_elements=alvo)
+        return query.on_conflict_do_update(
+            index_elements=alvo,
+            set_={coluna: query.excluded[coluna] for coluna in atualizar}
+        )
+
+    def garantir_chave_unica(self, nome_tabela, coluna):
+        inspector = inspect(self.cria_engine())
+        for indice in inspector.get_indexes(nome_tabela):
+            if indice.get('unique') and indice['column_names'] == [coluna]:
+                return False
+
+        with self.cria_engine().begin() as conn:
+            conn.execute(text(
+                f'DELETE FROM "{nome_tabela}" WHERE id NOT IN '
+                f'(SELECT MIN(id) FROM "{nome_tabela}" GROUP BY "{coluna}")'
+            ))
+            conn.execute(text(
+                f'CREATE UNIQUE INDEX "uq_{nome_tabela}_{coluna}" ON "{nome_tabela}" ("{coluna}")'
+            ))
+        self.invalidar_cache(nome_tabela)
+        print(f"Chave única em '{nome_tabela}.{coluna}' criada com sucesso.")
+        return True
+
+atexit.register(meusqldb.fechar_todas)
@@ -0,0 +1,345 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import cache_http
+import config
+import consultas
+import esquema
+import http_cliente
+from main import main
+
+# Benchmarks dos caminhos quentes de ingestão e consulta. As respostas do
+# NOAA, do ipinfo e do open-meteo vêm das fixtures gravadas em fixtures/ e o
+# banco é um SQLite descartável (banco.meusqlite) num diretório temporário,
+# então nada depende de rede nem de um servidor MySQL.
+#
+#   python benchmarks/bench.py
+#   python benchmarks/bench.py --linhas 1000 100000 10000000 --dispositivos 1 50 500
+#   python benchmarks/bench.py --salvar-baseline   # grava benchmarks/baseline.json
+#
+# Cada cenário é medido `--repeticoes` vezes (latência p50/p95/p99 e itens/s)
+# e mais uma vez sob tracemalloc para o pico de memória alocada pelo Python.
+# Com um baseline salvo, o p50 de cada cenário é comparado com o dele.
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Um ano de registros por minuto, o período longo que os painéis leem cru.
+MINUTOS_ANO = 365 * 24 * 60
+
+
+def carregar_fixture(nome):
+    with open(os.path.join(FIXTURES, nome), 'rb') as arquivo:
+        return arquivo.read()
+
+
+class RespostaFixture:
+    def __init__(self, corpo, status_code=200):
+        self.content = corpo if isinstance(corpo, bytes) else corpo.encode('utf-8')
+        self.status_code = status_code
+        self.headers = {}
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        pass
+
+
+class Fixtures:
+    """Substitui http_cliente.get e cache_http.buscar pelas respostas gravadas."""
+    def __init__(self, agora):
+        # O feed gravado é deslocado para terminar agora, como o feed ao vivo.
+        feed = json.loads(carregar_fixture('noaa_planetary_k_index_1m.json'))
+        deslocamento = agora - datetime.fromisoformat(feed[-1]['time_tag'])
+        for item in feed:
+            item['time_tag'] = (datetime.fromisoformat(item['time_tag']) + deslocamento).isoformat()
+        self.feed = feed
+        self.noaa = json.dumps(feed).encode('utf-8')
+        self.ipinfo = carregar_fixture('ipinfo.json')
+        self.open_meteo = json.loads(carregar_fixture('open_meteo_current_weather.json'))
+        self.open_meteo['current_weather']['time'] = agora.strftime('%Y-%m-%dT%H:%M')
+
+    def instalar(self):
+        http_cliente.get = self.get
+        cache_http.buscar = self.buscar
+
+    def buscar(self, url, params=None, revalidar=False):
+        return 200, self.noaa, True
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        if 'ipify' in url:
+            return RespostaFixture('177.37.100.21')
+        if 'ipinfo' in url:
+            return RespostaFixture(self.ipinfo)
+        if 'open-meteo' in url:
+            latitudes = str(params['latitude']).split(',')
+            longitudes = str(params['longitude']).split(',')
+            respostas = [
+                {**self.open_meteo, 'latitude': float(latitude), 'longitude': float(longitude)}
+                for latitude, longitude in zip(latitudes, longitudes)
+            ]
+            return RespostaFixture(json.dumps(respostas[0] if len(respostas) == 1 else respostas))
+        return RespostaFixture('', 404)
+
+
+def banco_novo(diretorio, nome):
+    config.BANCO = 'sqlite'
+    config.ARQUIVO_SQLITE = os.path.join(diretorio, nome + '.db')
+    db = config.conectar()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.criar_banco()
+        esquema.garantir_esquema(db)
+    return db
+
+
+def preencher_kp(db, linhas, ate, tamanho_lote=50000):
+    """`linhas` minutos de kp_indices terminando antes de `ate`, e os resumos do período."""
+    import agregados
+
+    inicio = ate - timedelta(minutes=linhas)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for deslocamento in range(0, linhas, tamanho_lote):
+            lote = []
+            for minuto in range(deslocamento, min(deslocamento + tamanho_lote, linhas)):
+                estimado = (minuto * 7 % 27) / 3
+                lote.append({
+                    'time_tag': inicio + timedelta(minutes=minuto),
+                    'kp_index': int(estimado),
+                    'estimated_kp': estimado,
+                    'kp': f"{int(estimado)}Z"
+                })
+            db.inserir_dados('kp_indices', lote)
+        agregados.atualizar_rollups_kp(db, inicio, ate - timedelta(minutes=1))
+
+
+def linhas_clima(quantidade, hora):
+    return [
+        {
+            'hora': hora,
+            'temperatura': 20 + indice % 15,
+            'velocidade_vent': indice % 30,
+            'direcao_vent': indice % 360,
+            'latitude': -15.6 + indice * 0.001,
+            'longitude': -56.1,
+            'device_id': None
+        }
+        for indice in range(quantidade)
+    ]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))]
+
+
+def medir(funcao, repeticoes, aquecimento=1):
+    """Roda `funcao` (que retorna quantos itens processou) e resume latência, vazão e pico de memória."""
+    silencio = io.StringIO()
+    with contextlib.redirect_stdout(silencio):
+        for _ in range(aquecimento):
+            funcao()
+        tempos = []
+        itens = 0
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            itens += funcao() or 0
+            tempos.append(time.perf_counter() - inicio)
+            silencio.seek(0)
+            silencio.truncate()
+
+        tracemalloc.start()
+        try:
+            funcao()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    total = sum(tempos)
+    return {
+        'repeticoes': repeticoes,
+        'p50_ms': percentil(tempos, 50) * 1000,
+        'p95_ms': percentil(tempos, 95) * 1000,
+        'p99_ms': percentil(tempos, 99) * 1000,
+        'media_ms': total / repeticoes * 1000,
+        'itens_por_s': itens / total if total > 0 else 0.0,
+        'pico_mb': pico / (1024 * 1024)
+    }
+
+
+def cenarios_tamanho(diretorio, linhas, agora, fixtures):
+    """Cenários que dependem do tamanho das tabelas: kp_indices com `linhas` registros."""
+    db = banco_novo(diretorio, f'tabela_{linhas}')
+    preencher_kp(db, linhas, datetime.fromisoformat(fixtures.feed[0]['time_tag']))
+    instancia = main()
+
+    def inserir_kp():
+        instancia.inserir_incice_kp(incremental=False)
+        return len(fixtures.feed)
+
+    def inserir_clima():
+        instancia.inserir_clima()
+        return 1
+
+    def inserir_dados():
+        db.inserir_dados('clima', linhas_clima(1000, agora))
+        return 1000
+
+    def selecionar_janela():
+        return len(db.selecionar_dados('kp_indices', {'time_tag': ('between', agora - timedelta(days=1), agora)}))
+
+    def selecionar_ultimos():
+        return len(db.selecionar_dados('kp_indices', ordenar_por='-time_tag', limite=50))
+
+    def periodo(dias):
+        def consultar():
+            _, df_hist, df_prev = consultas.periodo_kp(db, agora - timedelta(days=dias), agora)
+            return len(df_hist) + len(df_prev)
+        return consultar
+
+    yield 'main.inserir_incice_kp', inserir_kp
+    yield 'main.inserir_clima', inserir_clima
+    yield 'meusqldb.inserir_dados (1000 linhas)', inserir_dados
+    yield 'meusqldb.selecionar_dados (últimas 24h)', selecionar_janela
+    yield 'meusqldb.selecionar_dados (últimos 50)', selecionar_ultimos
+    yield 'get_and_prepare_data (1 dia)', periodo(1)
+    yield 'get_and_prepare_data (30 dias)', periodo(30)
+    yield 'get_and_prepare_data (1 ano)', periodo(365)
+    db.fechar()
+
+
+def cenarios_ano(diretorio, agora):
+    """Leitura crua de um ano de minutos do kp_indices para um DataFrame."""
+    db = banco_novo(diretorio, 'ano')
+    preencher_kp(db, MINUTOS_ANO, agora)
+
+    def ler_ano():
+        df = db.selecionar_dataframe(
+            'kp_indices', {'time_tag': ('between', agora - timedelta(days=365), agora)},
+            colunas=['time_tag', 'estimated_kp', 'kp_index'], ordenar_por='time_tag'
+        )
+        return len(df)
+
+    yield 'meusqldb.selecionar_dataframe (1 ano de minutos)', ler_ano
+    db.fechar()
+
+
+def cenarios_frota(diretorio, dispositivos):
+    """Ciclo de clima da frota com `dispositivos` estações ativas."""
+    db = banco_novo(diretorio, f'frota_{dispositivos}')
+    instancia = main()
+    with contextlib.redirect_stdout(io.StringIO()):
+        instancia.registrar_dispositivos([
+            {
+                'identificador': f'estacao-{indice}',
+                'latitude': str(-15.0 - indice * 0.05),
+                'longitude': str(-56.0 - indice % 20 * 0.05),
+                'ativo': True
+            }
+            for indice in range(dispositivos)
+        ])
+    yield 'main.ciclo_frota', instancia.ciclo_frota
+    db.fechar()
+
+
+def comparar(resultados, baseline, tolerancia):
+    """Marca os cenários cujo p50 piorou mais que `tolerancia` em relação ao baseline."""
+    regressoes = []
+    for chave, atual in resultados.items():
+        anterior = baseline.get(chave)
+        if anterior is None:
+            atual['vs_baseline'] = None
+            continue
+        razao = atual['p50_ms'] / anterior['p50_ms'] if anterior['p50_ms'] else float('inf')
+        atual['vs_baseline'] = razao
+        if razao > 1 + tolerancia:
+            regressoes.append(chave)
+    return regressoes
+
+
+def imprimir(resultados):
+    print(f"{'cenário':<58} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'itens/s':>11} {'pico MB':>8} {'vs base':>8}")
+    for chave, r in resultados.items():
+        base = f"{r['vs_baseline']:.2f}x" if r.get('vs_baseline') is not None else '-'
+        print(
+            f"{chave:<58} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+            f"{r['itens_por_s']:>11.0f} {r['pico_mb']:>8.1f} {base:>8}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de ingestão e consulta com fixtures e SQLite local.")
+    parser.add_argument('--linhas', type=int, nargs='+', default=[1000, 100000],
+                        help="tamanhos do kp_indices (p.ex. 1000 100000 10000000)")
+    parser.add_argument('--dispositivos', type=int, nargs='+', default=[1, 50, 500],
+                        help="tamanhos da frota para o ciclo de clima")
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--sem-ano', action='store_true', help="pula a leitura de um ano de minutos (leva alguns segundos para preencher)")
+    parser.add_argument('--filtro', help="roda só os cenários cujo nome contém este texto")
+    parser.add_argument('--baseline', default=BASELINE, help="arquivo de baseline para comparar/salvar")
+    parser.add_argument('--salvar-baseline', action='store_true', help="grava os resultados como novo baseline")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="piora aceitável do p50 (0.2 = 20%%)")
+    parser.add_argument('--saida', help="grava os resultados desta execução em JSON")
+    args = parser.parse_args()
+
+    agora = datetime.now().replace(second=0, microsecond=0)
+    fixtures = Fixtures(agora)
+    fixtures.instalar()
+
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix='bench_') as diretorio:
+        # Caches em disco (dispositivo, arquivo em Parquet) ficam no diretório temporário.
+        os.chdir(diretorio)
+        grupos = [(f'{linhas} linhas', cenarios_tamanho(diretorio, linhas, agora, fixtures)) for linhas in args.linhas]
+        if not args.sem_ano:
+            grupos.append((f'{MINUTOS_ANO} linhas', cenarios_ano(diretorio, agora)))
+        grupos += [(f'{quantidade} dispositivos', cenarios_frota(diretorio, quantidade)) for quantidade in args.dispositivos]
+        for parametro, cenarios in grupos:
+            for nome, funcao in cenarios:
+                chave = f"{nome} [{parametro}]"
+                if args.filtro and args.filtro not in chave:
+                    continue
+                resultados[chave] = medir(funcao, args.repeticoes)
+                print(f"{chave}: p50 {resultados[chave]['p50_ms']:.2f} ms", file=sys.stderr)
+        os.chdir(RAIZ)
+
+    regressoes = []
+    if os.path.exists(args.baseline) and not args.salvar_baseline:
+        with open(args.baseline, encoding='utf-8') as arquivo:
+            regressoes = comparar(resultados, json.load(arquivo)['cenarios'], args.tolerancia)
+
+    imprimir(resultados)
+
+    execucao = {
+        'data': datetime.now().isoformat(),
+        'maquina': {'python': platform.python_version(), 'sistema': platform.platform(), 'cpus': os.cpu_count()},
+        'cenarios': resultados
+    }
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(execucao, arquivo, indent=2, ensure_ascii=False)
+    if args.salvar_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as arquivo:
+            json.dump(execucao, arquivo, indent=2, ensure_ascii=False)
+        print(f"Baseline salvo em '{args.baseline}'.")
+    if regressoes:
+        print(f"{len(regressoes)} cenário(s) mais lentos que o baseline além de {args.tolerancia:.0%}:")
+        for chave in regressoes:
+            print(f"  {chave}")
+        sys.exit(1)
@@ -0,0 +1,213 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import banco
+import cache_http
+import clima
+import config
+import dados_dispo
+import esquema
+import http_cliente
+import indice_kp
+from main import main
+from bench import percentil
+from stub_servidor import ServidorStub
+
+# Gerador de carga de ponta a ponta: roda o ciclo real de ingestão de main
+# contra o stub local (ou outro servidor em --url), numa taxa alvo de ciclos
+# por segundo e com vários ciclos ao mesmo tempo, e mede linhas gravadas por
+# segundo e a latência de cada ciclo. A carga é em malha aberta: cada ciclo
+# tem um horário marcado e a latência conta a partir dele, então a fila
+# acumulada quando o sistema não acompanha a taxa aparece na cauda.
+#
+#   python benchmarks/carga.py --taxa 5 --duracao 60 --concorrencia 8
+#   python benchmarks/carga.py --ciclo frota --dispositivos 500 --latencia 0.2 --taxa-erro 0.05
+
+# Tabelas cujas linhas contam como dados ingeridos (resumos e estado não entram).
+TABELAS_DADOS = {'kp_indices', 'clima', 'dispositivo'}
+
+
+class ContadorLinhas:
+    """Soma as linhas enviadas por inserir_dados/upsert_dados às tabelas de dados."""
+    def __init__(self):
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def instalar(self):
+        for nome in ('inserir_dados', 'upsert_dados'):
+            original = getattr(banco.meusqldb, nome)
+
+            def contando(db, nome_tabela, dados, *args, _original=original, **kwargs):
+                resultado = _original(db, nome_tabela, dados, *args, **kwargs)
+                if nome_tabela in TABELAS_DADOS:
+                    with self._lock:
+                        self.total += 1 if isinstance(dados, dict) else len(dados)
+                return resultado
+            setattr(banco.meusqldb, nome, contando)
+
+
+def apontar_para(url):
+    """Faz indice_kp, clima e dados_dispo buscarem em `url` em vez das APIs públicas."""
+    indice_kp.URL_BASE = url
+    clima.URL_BASE = url
+    dados_dispo.URL_IPINFO = url + '/json'
+    dados_dispo.URL_IP_PUBLICO = url + '/ip'
+
+
+def escolher_ciclo(nome):
+    instancia = main()
+    return {
+        'pipeline': instancia.pipeline,
+        'kp': instancia.inserir_incice_kp,
+        'clima': instancia.inserir_clima,
+        'frota': instancia.ciclo_frota,
+    }[nome]
+
+
+def rodar(ciclo, taxa, duracao, concorrencia, contador, saida=sys.stderr):
+    """Dispara `ciclo` `taxa` vezes por segundo durante `duracao` segundos. Retorna o resumo."""
+    resultados = []
+    lock = threading.Lock()
+
+    def executar(agendado):
+        try:
+            ciclo()
+            erro = None
+        except Exception as e:
+            erro = e
+        fim = time.monotonic()
+        with lock:
+            resultados.append((fim - agendado, erro is None, fim))
+
+    intervalo = 1 / taxa
+    inicio = time.monotonic()
+    proximo_relatorio = inicio + 5
+    agendados = 0
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        while True:
+            agendado = inicio + agendados * intervalo
+            if agendado - inicio >= duracao:
+                break
+            espera = agendado - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            executor.submit(executar, agendado)
+            agendados += 1
+
+            if time.monotonic() >= proximo_relatorio:
+                decorrido = time.monotonic() - inicio
+                with lock:
+                    concluidos = len(resultados)
+                print(
+                    f"{decorrido:5.0f}s: {concluidos}/{agendados} ciclos, {contador.total} linhas "
+                    f"({contador.total / decorrido:.0f} linhas/s)", file=saida
+                )
+                proximo_relatorio += 5
+
+    fim = max((r[2] for r in resultados), default=time.monotonic())
+    decorrido = fim - inicio
+    latencias = [r[0] for r in resultados]
+    return {
+        'agendados': agendados,
+        'concluidos': sum(1 for r in resultados if r[1]),
+        'falhas': sum(1 for r in resultados if not r[1]),
+        'duracao_s': decorrido,
+        'ciclos_por_s': len(resultados) / decorrido if decorrido > 0 else 0.0,
+        'linhas': contador.total,
+        'linhas_por_s': contador.total / decorrido if decorrido > 0 else 0.0,
+        'p50_ms': percentil(latencias, 50) * 1000 if latencias else None,
+        'p95_ms': percentil(latencias, 95) * 1000 if latencias else None,
+        'p99_ms': percentil(latencias, 99) * 1000 if latencias else None,
+        'max_ms': max(latencias) * 1000 if latencias else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga de ponta a ponta do ciclo de ingestão contra o stub local.")
+    parser.add_argument('--ciclo', choices=['pipeline', 'kp', 'clima', 'frota'], default='pipeline')
+    parser.add_argument('--taxa', type=float, default=2.0, help="ciclos iniciados por segundo")
+    parser.add_argument('--duracao', type=float, default=30.0, help="segundos de carga")
+    parser.add_argument('--concorrencia', type=int, default=4, help="ciclos simultâneos no máximo")
+    parser.add_argument('--dispositivos', type=int, default=100, help="estações registradas para --ciclo frota")
+    parser.add_argument('--banco', choices=['temporario', 'config'], default='temporario',
+                        help="SQLite descartável ou o banco de config.py")
+    parser.add_argument('--ttl-cache', type=float, default=0,
+                        help="TTL do cache HTTP do feed do NOAA (0 = revalida a cada ciclo)")
+    parser.add_argument('--concorrencia-http', type=int, default=4, help="requisições simultâneas por host")
+    parser.add_argument('--url', help="usa um stub já rodando em vez de iniciar um")
+    parser.add_argument('--latencia', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--taxa-erro', type=float, default=0.0)
+    parser.add_argument('--bytes-por-segundo', type=int)
+    parser.add_argument('--sem-etag', action='store_true', help="o stub sempre devolve o feed completo")
+    parser.add_argument('--verboso', action='store_true', help="mantém as mensagens da ingestão")
+    args = parser.parse_args()
+
+    stub = None
+    if args.url is None:
+        stub = ServidorStub(
+            latencia=args.latencia, jitter=args.jitter, taxa_erro=args.taxa_erro,
+            bytes_por_segundo=args.bytes_por_segundo, etag=not args.sem_etag
+        ).iniciar()
+    apontar_para(args.url or stub.url)
+
+    with tempfile.TemporaryDirectory(prefix='carga_') as diretorio:
+        # Caches em disco (HTTP, dispositivo) e o SQLite descartável ficam no diretório temporário.
+        os.chdir(diretorio)
+        if args.banco == 'temporario':
+            config.BANCO = 'sqlite'
+            config.ARQUIVO_SQLITE = os.path.join(diretorio, 'carga.db')
+        db = config.conectar()
+        db.criar_banco()
+        esquema.garantir_esquema(db)
+
+        http_cliente.configurar(concorrencia_por_host=args.concorrencia_http)
+        cache_http.cache().ttl = args.ttl_cache
+        if args.ciclo == 'frota':
+            main().registrar_dispositivos([
+                {
+                    'identificador': f'carga-{indice}',
+                    'latitude': str(-15.0 - indice * 0.05),
+                    'longitude': str(-56.0 - indice % 20 * 0.05),
+                    'ativo': True
+                }
+                for indice in range(args.dispositivos)
+            ])
+
+        contador = ContadorLinhas()
+        contador.instalar()
+        saida = sys.stdout
+        if not args.verboso:
+            sys.stdout = open(os.devnull, 'w')
+        try:
+            resumo = rodar(escolher_ciclo(args.ciclo), args.taxa, args.duracao, args.concorrencia, contador)
+        finally:
+            if not args.verboso:
+                sys.stdout.close()
+                sys.stdout = saida
+            db.fechar_todas()
+            os.chdir(RAIZ)
+
+    if stub is not None:
+        stub.parar()
+
+    print(f"Ciclo '{args.ciclo}' a {args.taxa:g}/s por {args.duracao:g}s com até {args.concorrencia} simultâneos:")
+    print(f"  ciclos: {resumo['concluidos']} concluídos, {resumo['falhas']} falhas, {resumo['agendados']} agendados")
+    print(f"  vazão: {resumo['ciclos_por_s']:.2f} ciclos/s, {resumo['linhas_por_s']:.0f} linhas/s ({resumo['linhas']} linhas)")
+    if resumo['p50_ms'] is not None:
+        print(
+            f"  latência: p50 {resumo['p50_ms']:.0f} ms, p95 {resumo['p95_ms']:.0f} ms, "
+            f"p99 {resumo['p99_ms']:.0f} ms, máx {resumo['max_ms']:.0f} ms"
+        )
+    if stub is not None:
+        print(f"  stub: {stub.contadores['requisicoes']} requisições, {stub.contadores['erros']} erros injetados")
+    if resumo['duracao_s'] > args.duracao * 1.1:
+        print("  a taxa alvo não foi sustentada: a fila de ciclos terminou depois da janela de carga.")
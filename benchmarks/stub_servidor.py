@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Servidor local que responde como o NOAA, o open-meteo, o ipinfo e o ipify
+# a partir das fixtures gravadas em fixtures/, para testar a ingestão sem
+# rede e acima dos limites das APIs reais. Pode injetar latência, erros e
+# corpos lentos. Para apontar a coleta para ele:
+#
+#   NOAA_URL_BASE=http://127.0.0.1:8765 OPEN_METEO_URL_BASE=http://127.0.0.1:8765 \
+#   IPINFO_URL=http://127.0.0.1:8765/json IP_PUBLICO_URL=http://127.0.0.1:8765/ip python main.py
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def _fixture(nome):
+    with open(os.path.join(FIXTURES, nome), encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+class _Manipulador(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, formato, *args):
+        if self.server.stub.verboso:
+            super().log_message(formato, *args)
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub.contar('requisicoes')
+        if stub.latencia or stub.jitter:
+            time.sleep(stub.latencia + random.uniform(0, stub.jitter))
+        if stub.taxa_erro and random.random() < stub.taxa_erro:
+            stub.contar('erros')
+            self._responder(stub.status_erro, b'{"erro": "injetado pelo stub"}', {'Retry-After': '0'})
+            return
+
+        partes = urlsplit(self.path)
+        params = parse_qs(partes.query)
+        if partes.path == '/json/planetary_k_index_1m.json':
+            corpo, etag = stub.feed_kp()
+            if stub.etag and self.headers.get('If-None-Match') == etag:
+                self._responder(304, b'', {'ETag': etag})
+            else:
+                self._responder(200, corpo, {'ETag': etag} if stub.etag else {})
+        elif partes.path == '/v1/forecast':
+            self._responder(200, stub.clima(params.get('latitude', ['0'])[0], params.get('longitude', ['0'])[0]))
+        elif partes.path == '/json':
+            self._responder(200, json.dumps(stub.ipinfo).encode('utf-8'))
+        elif partes.path == '/ip':
+            self._responder(200, stub.ipinfo['ip'].encode('utf-8'), {'Content-Type': 'text/plain'})
+        else:
+            self._responder(404, b'{"erro": "rota desconhecida"}')
+
+    def _responder(self, status, corpo, cabecalhos=None):
+        self.send_response(status)
+        cabecalhos = {'Content-Type': 'application/json', **(cabecalhos or {})}
+        for nome, valor in cabecalhos.items():
+            self.send_header(nome, valor)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+
+        bytes_por_segundo = self.server.stub.bytes_por_segundo
+        if not bytes_por_segundo:
+            self.wfile.write(corpo)
+            return
+        # Corpo lento: blocos de até 1/10 de segundo de banda.
+        bloco = max(1, int(bytes_por_segundo / 10))
+        for inicio in range(0, len(corpo), bloco):
+            self.wfile.write(corpo[inicio:inicio + bloco])
+            self.wfile.flush()
+            time.sleep(bloco / bytes_por_segundo)
+
+
+class ServidorStub:
+    """
+    latencia/jitter: segundos de espera antes de cada resposta (jitter é
+    sorteado entre 0 e o valor dado). taxa_erro: fração das requisições
+    respondidas com `status_erro`. bytes_por_segundo: banda do corpo (None = sem limite).
+    """
+    def __init__(self, host='127.0.0.1', porta=0, latencia=0.0, jitter=0.0, taxa_erro=0.0,
+                 status_erro=503, bytes_por_segundo=None, etag=True, verboso=False):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.taxa_erro = taxa_erro
+        self.status_erro = status_erro
+        self.bytes_por_segundo = bytes_por_segundo
+        self.etag = etag
+        self.verboso = verboso
+
+        self.ipinfo = _fixture('ipinfo.json')
+        self.modelo_clima = _fixture('open_meteo_current_weather.json')
+        self.modelo_kp = _fixture('noaa_planetary_k_index_1m.json')
+        self._feed = (None, None, None)
+        self._lock = threading.Lock()
+        self.contadores = {'requisicoes': 0, 'erros': 0}
+
+        self._servidor = ThreadingHTTPServer((host, porta), _Manipulador)
+        self._servidor.daemon_threads = True
+        self._servidor.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self._servidor.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def contar(self, nome):
+        with self._lock:
+            self.contadores[nome] += 1
+
+    def feed_kp(self):
+        """O feed gravado deslocado para terminar no minuto atual; muda (nova ETag) a cada minuto."""
+        minuto = datetime.now().replace(second=0, microsecond=0)
+        with self._lock:
+            if self._feed[0] != minuto:
+                deslocamento = minuto - datetime.fromisoformat(self.modelo_kp[-1]['time_tag'])
+                feed = [
+                    {**item, 'time_tag': (datetime.fromisoformat(item['time_tag']) + deslocamento).isoformat()}
+                    for item in self.modelo_kp
+                ]
+                self._feed = (minuto, json.dumps(feed).encode('utf-8'), f'"{minuto:%Y%m%d%H%M}"')
+            return self._feed[1], self._feed[2]
+
+    def clima(self, latitudes, longitudes):
+        agora = datetime.now().strftime('%Y-%m-%dT%H:%M')
+        respostas = [
+            {
+                **self.modelo_clima,
+                'latitude': float(latitude),
+                'longitude': float(longitude),
+                'current_weather': {**self.modelo_clima['current_weather'], 'time': agora}
+            }
+            for latitude, longitude in zip(latitudes.split(','), longitudes.split(','))
+        ]
+        return json.dumps(respostas[0] if len(respostas) == 1 else respostas).encode('utf-8')
+
+    def variaveis_ambiente(self):
+        """As variáveis que apontam indice_kp, clima e dados_dispo para este servidor."""
+        return {
+            'NOAA_URL_BASE': self.url,
+            'OPEN_METEO_URL_BASE': self.url,
+            'IPINFO_URL': self.url + '/json',
+            'IP_PUBLICO_URL': self.url + '/ip'
+        }
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def servir(self):
+        """Atende na thread atual até parar() (ou Ctrl+C)."""
+        self._servidor.serve_forever()
+
+    def parar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub local do NOAA, open-meteo e ipinfo com as respostas gravadas.")
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--latencia', type=float, default=0.0, help="segundos antes de cada resposta")
+    parser.add_argument('--jitter', type=float, default=0.0, help="espera extra sorteada entre 0 e este valor (s)")
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help="fração de respostas com erro (0 a 1)")
+    parser.add_argument('--status-erro', type=int, default=503)
+    parser.add_argument('--bytes-por-segundo', type=int, help="banda do corpo das respostas")
+    parser.add_argument('--sem-etag', action='store_true', help="não responde 304 ao feed do NOAA")
+    parser.add_argument('--verboso', action='store_true')
+    args = parser.parse_args()
+
+    stub = ServidorStub(
+        porta=args.porta, latencia=args.latencia, jitter=args.jitter, taxa_erro=args.taxa_erro,
+        status_erro=args.status_erro, bytes_por_segundo=args.bytes_por_segundo,
+        etag=not args.sem_etag, verboso=args.verboso
+    )
+    print(f"Stub ouvindo em {stub.url}. Variáveis para a coleta:")
+    for nome, valor in stub.variaveis_ambiente().items():
+        print(f"  {nome}={valor}")
+    try:
+        stub.servir()
+    except KeyboardInterrupt:
+        pass
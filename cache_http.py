@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+import http_cliente
+
+# Cache em disco das respostas HTTP com revalidação condicional
+# (ETag / Last-Modified). Cada entrada são dois arquivos no diretório do
+# cache: <chave>.json com os metadados e <chave>.body com o corpo.
+
+
+class CacheHTTP:
+    def __init__(self, diretorio='.cache_http', ttl=60, tamanho_maximo=50 * 1024 * 1024):
+        """
+        ttl: segundos em que uma entrada é usada sem nem consultar o servidor.
+        tamanho_maximo: bytes somados dos corpos; acima disso as entradas
+            acessadas há mais tempo são removidas.
+        """
+        self.diretorio = diretorio
+        self.ttl = ttl
+        self.tamanho_maximo = tamanho_maximo
+        self._lock = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminhos(self, url, params):
+        chave_url = url + ('?' + urlencode(sorted(params.items())) if params else '')
+        chave = hashlib.sha256(chave_url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.diretorio, chave)
+        return base + '.json', base + '.body'
+
+    def _ler(self, caminho_meta, caminho_corpo):
+        try:
+            with open(caminho_meta, encoding='utf-8') as arquivo:
+                meta = json.load(arquivo)
+            with open(caminho_corpo, 'rb') as arquivo:
+                corpo = arquivo.read()
+        except (OSError, ValueError):
+            return None, None
+        os.utime(caminho_corpo)
+        return meta, corpo
+
+    def _gravar(self, caminho, conteudo):
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(temporario, 'wb') as arquivo:
+            arquivo.write(conteudo)
+        os.replace(temporario, caminho)
+
+    def _despejar(self):
+        corpos = []
+        for nome in os.listdir(self.diretorio):
+            if nome.endswith('.body'):
+                caminho = os.path.join(self.diretorio, nome)
+                try:
+                    info = os.stat(caminho)
+                except OSError:
+                    continue
+                corpos.append((info.st_mtime, info.st_size, caminho))
+
+        total = sum(tamanho for _, tamanho, _ in corpos)
+        for _, tamanho, caminho in sorted(corpos):
+            if total <= self.tamanho_maximo:
+                break
+            for arquivo in (caminho, caminho[:-len('.body')] + '.json'):
+                try:
+                    os.remove(arquivo)
+                except OSError:
+                    pass
+            total -= tamanho
+
+    def buscar(self, url, params=None, revalidar=False):
+        """
+        Retorna (status, corpo, modificado). `modificado` é False quando o
+        conteúdo é o mesmo da última busca (entrada dentro do TTL ou 304 do
+        servidor), e o chamador pode pular o processamento. Em erro HTTP
+        retorna o status recebido e o corpo da resposta de erro. Com
+        `revalidar`, ignora o TTL e sempre faz a requisição condicional.
+        """
+        caminho_meta, caminho_corpo = self._caminhos(url, params)
+        with self._lock:
+            meta, corpo = self._ler(caminho_meta, caminho_corpo)
+
+        if meta and not revalidar and time.time() - meta['salvo_em'] < self.ttl:
+            return 200, corpo, False
+
+        cabecalhos = {}
+        if meta:
+            if meta.get('etag'):
+                cabecalhos['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                cabecalhos['If-Modified-Since'] = meta['last_modified']
+
+        resposta = http_cliente.get(url, params=params, headers=cabecalhos)
+
+        if resposta.status_code == 304 and meta:
+            meta['salvo_em'] = time.time()
+            with self._lock:
+                self._gravar(caminho_meta, json.dumps(meta).encode('utf-8'))
+            return 304, corpo, False
+
+        if resposta.status_code != 200:
+            return resposta.status_code, resposta.content, False
+
+        meta = {
+            'url': url,
+            'etag': resposta.headers.get('ETag'),
+            'last_modified': resposta.headers.get('Last-Modified'),
+            'salvo_em': time.time()
+        }
+        with self._lock:
+            self._gravar(caminho_corpo, resposta.content)
+            self._gravar(caminho_meta, json.dumps(meta).encode('utf-8'))
+            self._despejar()
+        return 200, resposta.content, True
+
+
+_padrao = None
+_padrao_lock = threading.Lock()
+
+
+def cache():
+    """O CacheHTTP compartilhado pelo processo."""
+    global _padrao
+    with _padrao_lock:
+        if _padrao is None:
+            _padrao = CacheHTTP()
+        return _padrao
+
+
+def buscar(url, params=None, revalidar=False):
+    return cache().buscar(url, params, revalidar)
@@ -1,24 +1,78 @@
+import os
 import requests
+import http_cliente
+from concurrent.futures import ThreadPoolExecutor
+
+# Base da API do open-meteo; OPEN_METEO_URL_BASE aponta para outro servidor (p.ex. o stub local).
+URL_BASE = os.environ.get('OPEN_METEO_URL_BASE', 'https://api.open-meteo.com')
+CAMINHO_PREVISAO = '/v1/forecast'
 
 class climinha:
-    def __init__(self, longitude, latitude):
+    def __init__(self, longitude, latitude, url_base=None):
         self.longitude = longitude
         self.latitude = latitude
+        self.url_base = url_base
     def get_clima(self):
-        url = f"https://api.open-meteo.com/v1/forecast"
+        url = (self.url_base or URL_BASE) + CAMINHO_PREVISAO
         params = {
             "latitude": self.latitude,
             "longitude": self.longitude,
             "current_weather": True
         }
         try:
-            response = requests.get(url, params=params)
+            response = http_cliente.get(url, params=params)
             response.raise_for_status()  
             dados = response.json()
             return dados
         except requests.exceptions.RequestException as e:
             print(f"Erro ao obter dados climáticos: {e}")
             return None
+
+    @staticmethod
+    def get_clima_lote(locais, tamanho_lote=100, grade=0.01, max_concorrencia=1, url_base=None):
+        """
+        Clima atual de vários locais com uma requisição por lote de até
+        `tamanho_lote` pontos (o open-meteo aceita listas de coordenadas
+        separadas por vírgula). `locais` são pares (longitude, latitude), como
+        no construtor. Locais na mesma célula de `grade` graus são buscados uma
+        vez só. Até `max_concorrencia` lotes são buscados ao mesmo tempo.
+        Retorna uma lista na ordem de `locais`, com None onde a busca falhou.
+        """
+        url = (url_base or URL_BASE) + CAMINHO_PREVISAO
+        celulas = {}
+        for longitude, latitude in locais:
+            celula = (round(float(latitude) / grade) * grade, round(float(longitude) / grade) * grade)
+            celulas.setdefault(celula, None)
+
+        def buscar_lote(lote):
+            params = {
+                "latitude": ",".join(f"{latitude:.4f}" for latitude, _ in lote),
+                "longitude": ",".join(f"{longitude:.4f}" for _, longitude in lote),
+                "current_weather": True
+            }
+            try:
+                response = http_cliente.get(url, params=params)
+                response.raise_for_status()
+                dados = response.json()
+            except requests.exceptions.RequestException as e:
+                print(f"Erro ao obter dados climáticos do lote: {e}")
+                return lote, []
+            # Com um único ponto a API responde um objeto em vez de uma lista.
+            if isinstance(dados, dict):
+                dados = [dados]
+            return lote, dados
+
+        pendentes = list(celulas)
+        lotes = [pendentes[inicio:inicio + tamanho_lote] for inicio in range(0, len(pendentes), tamanho_lote)]
+        with ThreadPoolExecutor(max_workers=max(1, max_concorrencia)) as executor:
+            for lote, dados in executor.map(buscar_lote, lotes):
+                for celula, dados_celula in zip(lote, dados):
+                    celulas[celula] = dados_celula
+
+        return [
+            celulas[(round(float(latitude) / grade) * grade, round(float(longitude) / grade) * grade)]
+            for longitude, latitude in locais
+        ]
         
 if __name__ == "__main__":
     latitude = -23.5505
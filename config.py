@@ -0,0 +1,31 @@
+import os
+from banco import meusqldb, meusqlite
+
+# Configuração do banco num só lugar, lida do ambiente. BANCO=sqlite usa um
+# arquivo local (BANCO_ARQUIVO) em vez do servidor MySQL.
+BANCO = os.environ.get('BANCO', 'mysql')
+USER = os.environ.get('BANCO_USUARIO', 'root')
+PASSWORD = os.environ.get('BANCO_SENHA', 'MinhaSenhaSegura')
+HOST = os.environ.get('BANCO_HOST', '127.0.0.1')
+PORT = os.environ.get('BANCO_PORTA', '3306')
+DB_NAME = os.environ.get('BANCO_NOME', 'Banco_geral')
+ARQUIVO_SQLITE = os.environ.get('BANCO_ARQUIVO', os.path.join('dados', 'banco_geral.db'))
+
+# Pool de conexões, um por DSN no processo (ver banco.py).
+POOL_TAMANHO = int(os.environ.get('BANCO_POOL_TAMANHO', '5'))
+POOL_EXCEDENTE = int(os.environ.get('BANCO_POOL_EXCEDENTE', '10'))
+POOL_PRE_PING = os.environ.get('BANCO_POOL_PRE_PING', '1') not in ('0', 'false', 'nao')
+POOL_RECICLAR = int(os.environ.get('BANCO_POOL_RECICLAR', '3600'))
+
+
+def conectar():
+    """Instância do banco configurado; engines e pools são compartilhados por DSN."""
+    if BANCO == 'sqlite':
+        return meusqlite(ARQUIVO_SQLITE, pool_size=POOL_TAMANHO, max_overflow=POOL_EXCEDENTE)
+    if BANCO != 'mysql':
+        raise ValueError(f"Banco desconhecido em BANCO: {BANCO!r} (use 'mysql' ou 'sqlite').")
+    return meusqldb(
+        USER, PASSWORD, HOST, PORT, DB_NAME,
+        pool_size=POOL_TAMANHO, max_overflow=POOL_EXCEDENTE,
+        pool_pre_ping=POOL_PRE_PING, pool_recycle=POOL_RECICLAR
+    )
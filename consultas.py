@@ -0,0 +1,164 @@
+from sqlalchemy import select, func, case, desc
+from datetime import datetime
+
+import agregados
+import arquivo
+from retencao import proximo_mes
+
+# Consultas agregadas do índice Kp executadas no próprio banco, para que os
+# painéis recebam só os números prontos em vez do histórico inteiro. Períodos
+# que passam da retenção dos minutos no banco (agregados.RETENCAO_KP) são
+# calculados sobre o arquivo em Parquet somado ao banco.
+
+NIVEIS_KP = ["Calmo", "Instável", "Ativo", "Tempestade"]
+
+
+def nivel_kp(coluna_kp_index):
+    """Expressão SQL equivalente à classificação Calmo/Instável/Ativo/Tempestade."""
+    return case(
+        (coluna_kp_index <= 2, "Calmo"),
+        (coluna_kp_index == 3, "Instável"),
+        (coluna_kp_index == 4, "Ativo"),
+        else_="Tempestade"
+    )
+
+
+def _filtros_kp(tabela, inicio=None, fim=None, niveis=None):
+    condicoes = []
+    if inicio is not None:
+        condicoes.append(tabela.c.time_tag >= inicio)
+    if fim is not None:
+        condicoes.append(tabela.c.time_tag <= fim)
+    if niveis is not None:
+        condicoes.append(nivel_kp(tabela.c.kp_index).in_(list(niveis)))
+    return condicoes
+
+
+def niveis_kp(serie_kp_index):
+    """Calmo (<=2), Instável (3), Ativo (4), Tempestade (>=5), como em nivel_kp, para uma série do pandas."""
+    import pandas as pd
+
+    return pd.cut(serie_kp_index, bins=[float('-inf'), 2, 3, 4, float('inf')], labels=NIVEIS_KP)
+
+
+def _minutos_arquivados(db, inicio=None, fim=None, niveis=None):
+    """
+    Minutos do período com kp_level, do arquivo e do banco, se o período
+    começa antes do que o banco ainda guarda e há meses arquivados; senão None
+    (o banco tem o período inteiro e a consulta SQL basta).
+    """
+    bruto = agregados.RETENCAO_KP['bruto']
+    if bruto is None or (inicio is not None and inicio >= datetime.now() - bruto):
+        return None
+    meses = arquivo.arquivados('kp_indices')
+    if not meses:
+        return None
+
+    if fim is None:
+        ultimo = db.selecionar_dados('kp_indices', colunas=['time_tag'], ordenar_por='-time_tag', limite=1)
+        fim = ultimo[0]['time_tag'] if ultimo else proximo_mes(meses[-1])
+    df = arquivo.ler_com_banco(
+        db, 'kp_indices', inicio or meses[0], fim, colunas=['time_tag', 'estimated_kp', 'kp_index']
+    )
+    df['kp_level'] = niveis_kp(df['kp_index'])
+    if niveis is not None:
+        df = df[df['kp_level'].isin(list(niveis))]
+    return df
+
+
+def resumo_kp(db, inicio=None, fim=None, niveis=None):
+    """Média e máximo do Kp estimado, registros de tempestade (kp_index >= 5) e total."""
+    df = _minutos_arquivados(db, inicio, fim, niveis)
+    if df is not None:
+        return {
+            'media': float(df['estimated_kp'].mean()) if df['estimated_kp'].notna().any() else None,
+            'maximo': float(df['estimated_kp'].max()) if df['estimated_kp'].notna().any() else None,
+            'tempestades': int((df['kp_index'] >= 5).sum()),
+            'total': len(df)
+        }
+
+    tabela = db.tabela('kp_indices')
+    query = select(
+        func.avg(tabela.c.estimated_kp).label('media'),
+        func.max(tabela.c.estimated_kp).label('maximo'),
+        func.coalesce(func.sum(case((tabela.c.kp_index >= 5, 1), else_=0)), 0).label('tempestades'),
+        func.count().label('total')
+    ).where(*_filtros_kp(tabela, inicio, fim, niveis))
+
+    with db.cria_engine().connect() as conn:
+        linha = conn.execute(query).mappings().one()
+    return {
+        'media': float(linha['media']) if linha['media'] is not None else None,
+        'maximo': float(linha['maximo']) if linha['maximo'] is not None else None,
+        'tempestades': int(linha['tempestades']),
+        'total': int(linha['total'])
+    }
+
+
+def distribuicao_niveis(db, inicio=None, fim=None, niveis=None):
+    """Contagem de registros por nível de atividade, na ordem de NIVEIS_KP."""
+    df = _minutos_arquivados(db, inicio, fim, niveis)
+    if df is not None:
+        contagens = df['kp_level'].value_counts()
+        return {nome: int(contagens[nome]) for nome in NIVEIS_KP if contagens.get(nome, 0)}
+
+    tabela = db.tabela('kp_indices')
+    nivel = nivel_kp(tabela.c.kp_index).label('kp_level')
+    query = select(nivel, func.count().label('contagem')) \
+        .where(*_filtros_kp(tabela, inicio, fim, niveis)) \
+        .group_by(nivel)
+
+    with db.cria_engine().connect() as conn:
+        contagens = {linha['kp_level']: int(linha['contagem']) for linha in conn.execute(query).mappings()}
+    return {nome: contagens[nome] for nome in NIVEIS_KP if nome in contagens}
+
+
+def recentes_kp(db, inicio=None, fim=None, niveis=None, limite=10):
+    """Os `limite` registros mais recentes do período, do mais antigo para o mais novo."""
+    df = _minutos_arquivados(db, inicio, fim, niveis)
+    if df is not None:
+        df = df.tail(limite).astype({'kp_level': str})
+        return [
+            {**registro, 'time_tag': registro['time_tag'].to_pydatetime()}
+            for registro in df.to_dict('records')
+        ]
+
+    tabela = db.tabela('kp_indices')
+    query = select(
+        tabela.c.time_tag,
+        tabela.c.estimated_kp,
+        tabela.c.kp_index,
+        nivel_kp(tabela.c.kp_index).label('kp_level')
+    ).where(*_filtros_kp(tabela, inicio, fim, niveis)) \
+        .order_by(desc(tabela.c.time_tag)) \
+        .limit(limite)
+
+    with db.cria_engine().connect() as conn:
+        registros = [dict(linha) for linha in conn.execute(query).mappings()]
+    registros.reverse()
+    return registros
+
+
+def periodo_kp(db, inicio, fim):
+    """
+    Série do Kp entre inicio e fim e as previsões (time_tag no futuro).
+    Períodos longos vêm dos resumos por hora/dia, sem kp_index/kp_level; os
+    curtos vêm por minuto, do arquivo em Parquet e do banco.
+    Retorna (resolucao, df_hist, df_prev).
+    """
+    agora = datetime.now()
+    fim_hist = min(fim, agora)
+    # Os minutos descartados do banco continuam no arquivo, então só os resumos por hora expiram.
+    resolucao = agregados.escolher_resolucao(inicio, fim_hist, {**agregados.RETENCAO_KP, 'bruto': None})
+    if resolucao == 'bruto':
+        df_hist = arquivo.ler_com_banco(
+            db, 'kp_indices', inicio, fim_hist, colunas=['time_tag', 'estimated_kp', 'kp_index']
+        )
+    else:
+        resolucao, df_hist = agregados.serie_kp(db, inicio, fim_hist, resolucao)
+    df_prev = db.selecionar_dataframe('kp_indices', {'time_tag': ('>', agora)}, ordenar_por='time_tag')
+
+    for df in (df_hist, df_prev):
+        if 'kp_index' in df:
+            df['kp_level'] = niveis_kp(df['kp_index'])
+    return resolucao, df_hist, df_prev
@@ -1,18 +1,76 @@
+import json
+import os
+import time
 import requests
+import http_cliente
+
+# Localização do dispositivo em cache no disco: o ipinfo só é consultado
+# quando o cache expira ou quando o IP público mudou.
+ARQUIVO_CACHE = os.path.join('.cache_http', 'dispositivo.json')
+URL_IP_PUBLICO = os.environ.get('IP_PUBLICO_URL', "https://api.ipify.org")
+URL_IPINFO = os.environ.get('IPINFO_URL', "https://ipinfo.io/json")
 
 class dispositivo:
+    def __init__(self, ttl=6 * 3600, arquivo_cache=ARQUIVO_CACHE, verificar_ip=True,
+                 url_ipinfo=None, url_ip_publico=None):
+        self.ttl = ttl
+        self.arquivo_cache = arquivo_cache
+        self.verificar_ip = verificar_ip
+        self.url_ipinfo = url_ipinfo
+        self.url_ip_publico = url_ip_publico
+        # False quando get_dados devolveu exatamente o que já estava em cache.
+        self.alterado = None
+
+    def ler_cache(self):
+        try:
+            with open(self.arquivo_cache, encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+
+    def gravar_cache(self, dados):
+        os.makedirs(os.path.dirname(self.arquivo_cache) or '.', exist_ok=True)
+        temporario = self.arquivo_cache + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump({'salvo_em': time.time(), 'dados': dados}, arquivo)
+        os.replace(temporario, self.arquivo_cache)
+
+    def ip_publico(self):
+        # Consulta leve, fora da cota do ipinfo; None se não foi possível saber.
+        try:
+            response = http_cliente.get(self.url_ip_publico or URL_IP_PUBLICO)
+            if response.status_code == 200:
+                return response.text.strip()
+        except requests.RequestException:
+            pass
+        return None
+
     def get_dados(self):
+        cache = self.ler_cache()
+        if cache and time.time() - cache['salvo_em'] < self.ttl:
+            ip_atual = self.ip_publico() if self.verificar_ip else None
+            if ip_atual is None or ip_atual == cache['dados'].get('ip'):
+                self.alterado = False
+                return cache['dados']
+            print(f"IP público mudou ({cache['dados'].get('ip')} -> {ip_atual}); consultando o ipinfo.")
+
+        dados = self.buscar_ipinfo()
+        self.alterado = cache is None or dados != cache['dados']
+        self.gravar_cache(dados)
+        return dados
+
+    def buscar_ipinfo(self):
         try:
-            response = requests.get("https://ipinfo.io/json")
+            response = http_cliente.get(self.url_ipinfo or URL_IPINFO)
             if response.status_code == 200:
                 dados = response.json()
-                
+
                 if 'loc' in dados:
                     latitude, longitude = dados['loc'].split(',')
                     dados['latitude'] = latitude
                     dados['longitude'] = longitude
-                    del dados['loc'] 
-                
+                    del dados['loc']
+
                 return dados
             else:
                 print(f"Error: {response.text}")
@@ -0,0 +1,246 @@
+from sqlalchemy import inspect, select, text, Column, Integer, String, Float, DateTime, Boolean, MetaData, Table, Index, ForeignKey
+from datetime import datetime
+import threading
+
+# Definição única das tabelas do sistema. Qualquer mudança de esquema entra
+# como uma nova migração em MIGRACOES, nunca editando as já publicadas.
+metadata = MetaData()
+
+kp_indices = Table(
+    'kp_indices', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('time_tag', DateTime, nullable=False),
+    Column('kp_index', Integer, nullable=False),
+    Column('estimated_kp', Float, nullable=False),
+    Column('kp', String(10), nullable=False),
+    Index('uq_kp_indices_time_tag', 'time_tag', unique=True)
+)
+
+clima = Table(
+    'clima', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('hora', DateTime, nullable=False),
+    Column('temperatura', Float, nullable=False),
+    Column('velocidade_vent', Float, nullable=False),
+    Column('direcao_vent', Float, nullable=False),
+    Column('latitude', Float, nullable=False),
+    Column('longitude', Float, nullable=False),
+    Column('device_id', Integer, ForeignKey('dispositivo.id', name='fk_clima_dispositivo')),
+    Index('ix_clima_hora', 'hora'),
+    Index('ix_clima_local_hora', 'latitude', 'longitude', 'hora'),
+    Index('ix_clima_device_hora', 'device_id', 'hora')
+)
+
+dispositivo = Table(
+    'dispositivo', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('ip', String(50)),
+    Column('hostname', String(100)),
+    Column('city', String(50)),
+    Column('region', String(50)),
+    Column('country', String(10)),
+    Column('longitude', String(50)),
+    Column('latitude', String(50)),
+    Column('org', String(100)),
+    Column('postal', String(20)),
+    Column('timezone', String(50)),
+    Column('identificador', String(100)),
+    Column('ativo', Boolean, nullable=False, server_default=text('1')),
+    Index('uq_dispositivo_identificador', 'identificador', unique=True)
+)
+
+ingestao_estado = Table(
+    'ingestao_estado', metadata,
+    Column('fonte', String(50), primary_key=True),
+    Column('marca_dagua', DateTime),
+    Column('atualizado_em', DateTime)
+)
+
+
+# Resumos por hora e por dia, mantidos por agregados.py a cada ingestão.
+# A coluna de tempo tem o mesmo nome da tabela bruta (início do intervalo).
+def _tabela_rollup_kp(nome):
+    return Table(
+        nome, metadata,
+        Column('time_tag', DateTime, primary_key=True),
+        Column('amostras', Integer, nullable=False),
+        Column('min_estimated_kp', Float),
+        Column('max_estimated_kp', Float),
+        Column('avg_estimated_kp', Float),
+        Column('max_kp_index', Integer),
+        Column('minutos_tempestade', Integer, nullable=False)
+    )
+
+
+def _tabela_rollup_clima(nome):
+    return Table(
+        nome, metadata,
+        Column('hora', DateTime, primary_key=True),
+        Column('latitude', Float, primary_key=True),
+        Column('longitude', Float, primary_key=True),
+        Column('amostras', Integer, nullable=False),
+        Column('avg_temperatura', Float),
+        Column('max_temperatura', Float),
+        Column('avg_velocidade_vent', Float),
+        Column('max_velocidade_vent', Float)
+    )
+
+
+kp_horario = _tabela_rollup_kp('kp_horario')
+kp_diario = _tabela_rollup_kp('kp_diario')
+clima_horario = _tabela_rollup_clima('clima_horario')
+clima_diario = _tabela_rollup_clima('clima_diario')
+
+esquema_versao = Table(
+    'esquema_versao', metadata,
+    Column('versao', Integer, primary_key=True, autoincrement=False),
+    Column('descricao', String(200)),
+    Column('aplicada_em', DateTime)
+)
+
+
+def _garantir_indice(db, indice):
+    """Cria o índice se a tabela ainda não tiver um equivalente (mesmas colunas)."""
+    nome_tabela = indice.table.name
+    colunas = [coluna.name for coluna in indice.columns]
+    for existente in inspect(db.cria_engine()).get_indexes(nome_tabela):
+        if existente['column_names'] == colunas and (existente.get('unique') or not indice.unique):
+            return False
+    indice.create(db.cria_engine())
+    print(f"Índice '{indice.name}' criado em '{nome_tabela}'.")
+    return True
+
+
+def _m1_tabelas_base(db):
+    # Em bancos antigos as tabelas já existem; create_all só cria as que faltam.
+    metadata.create_all(db.cria_engine(), tables=[kp_indices, clima, dispositivo, ingestao_estado])
+
+
+def _m2_indices_kp(db):
+    db.garantir_chave_unica('kp_indices', 'time_tag')
+
+
+# Índices criados pela migração 3. Ficam listados por nome porque `clima`
+# ganhou depois índices sobre colunas que só existem a partir da migração 5.
+_INDICES_M3 = ('ix_clima_hora', 'ix_clima_local_hora')
+
+
+def _m3_indices_clima(db):
+    for indice in clima.indexes:
+        if indice.name in _INDICES_M3:
+            _garantir_indice(db, indice)
+
+
+def _m4_rollups(db):
+    import agregados
+
+    metadata.create_all(db.cria_engine(), tables=[kp_horario, kp_diario, clima_horario, clima_diario])
+    db.invalidar_cache()
+    # Preenche os resumos com o histórico que já existia antes desta versão.
+    for nome_tabela, coluna, atualizar in (
+        ('kp_indices', 'time_tag', agregados.atualizar_rollups_kp),
+        ('clima', 'hora', agregados.atualizar_rollups_clima),
+    ):
+        primeiro = db.selecionar_dados(nome_tabela, colunas=[coluna], ordenar_por=coluna, limite=1)
+        ultimo = db.selecionar_dados(nome_tabela, colunas=[coluna], ordenar_por='-' + coluna, limite=1)
+        if primeiro and ultimo:
+            atualizar(db, primeiro[0][coluna], ultimo[0][coluna])
+
+
+def _adicionar_coluna(db, tabela, coluna):
+    """ALTER TABLE ... ADD COLUMN se a coluna ainda não existir."""
+    engine = db.cria_engine()
+    existentes = {c['name'] for c in inspect(engine).get_columns(tabela.name)}
+    if coluna.name in existentes:
+        return False
+    tipo = coluna.type.compile(dialect=engine.dialect)
+    definicao = f"{coluna.name} {tipo}"
+    if coluna.server_default is not None:
+        definicao += f" NOT NULL DEFAULT {coluna.server_default.arg.text}"
+    for chave in coluna.foreign_keys:
+        if engine.dialect.name == 'sqlite':
+            # O SQLite não aceita ADD CONSTRAINT; a referência vai na própria coluna.
+            definicao += f" REFERENCES {chave.column.table.name}({chave.column.name})"
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {tabela.name} ADD COLUMN {definicao}"))
+        if engine.dialect.name != 'sqlite':
+            for chave in coluna.foreign_keys:
+                conn.execute(text(
+                    f"ALTER TABLE {tabela.name} ADD CONSTRAINT {chave.name} "
+                    f"FOREIGN KEY ({coluna.name}) REFERENCES {chave.column.table.name}({chave.column.name})"
+                ))
+    print(f"Coluna '{tabela.name}.{coluna.name}' adicionada.")
+    return True
+
+
+def _m5_frota(db):
+    _adicionar_coluna(db, dispositivo, dispositivo.c.identificador)
+    _adicionar_coluna(db, dispositivo, dispositivo.c.ativo)
+    _adicionar_coluna(db, clima, clima.c.device_id)
+    engine = db.cria_engine()
+    with engine.begin() as conn:
+        # Até aqui só existia o dispositivo local (id 1), dono de todo o clima gravado.
+        conn.execute(text("UPDATE dispositivo SET identificador = 'local' WHERE id = 1 AND identificador IS NULL"))
+        conn.execute(text(
+            "UPDATE clima SET device_id = 1 WHERE device_id IS NULL "
+            "AND EXISTS (SELECT 1 FROM dispositivo WHERE id = 1)"
+        ))
+    db.invalidar_cache()
+    indices = list(dispositivo.indexes) + [i for i in clima.indexes if i.name == 'ix_clima_device_hora']
+    for indice in indices:
+        _garantir_indice(db, indice)
+
+
+def _m6_particoes_kp(db):
+    import retencao
+
+    # Só no MySQL; nos outros bancos a retenção apaga por faixa de time_tag.
+    retencao.particionar_kp(db)
+
+
+MIGRACOES = [
+    (1, 'tabelas base', _m1_tabelas_base),
+    (2, 'chave única em kp_indices.time_tag', _m2_indices_kp),
+    (3, 'índices de hora e local em clima', _m3_indices_clima),
+    (4, 'resumos por hora e por dia de kp e clima', _m4_rollups),
+    (5, 'frota: identificador/ativo em dispositivo e clima.device_id', _m5_frota),
+    (6, 'partições mensais em kp_indices', _m6_particoes_kp),
+]
+VERSAO_ATUAL = MIGRACOES[-1][0]
+
+_migrados = set()
+_migrados_lock = threading.Lock()
+
+
+def migrar(db):
+    """Aplica as migrações pendentes e retorna a versão final do esquema."""
+    engine = db.cria_engine()
+    esquema_versao.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        aplicadas = set(conn.execute(select(esquema_versao.c.versao)).scalars())
+
+    for versao, descricao, migracao in MIGRACOES:
+        if versao in aplicadas:
+            continue
+        print(f"Aplicando migração {versao}: {descricao}...")
+        migracao(db)
+        with engine.begin() as conn:
+            conn.execute(esquema_versao.insert(), {
+                'versao': versao,
+                'descricao': descricao,
+                'aplicada_em': datetime.now()
+            })
+
+    db.invalidar_cache()
+    db.sincronizar_versao_esquema(VERSAO_ATUAL)
+    return VERSAO_ATUAL
+
+
+def garantir_esquema(db):
+    """Roda migrar() uma vez por processo para cada banco."""
+    with _migrados_lock:
+        if db.DATABASE_URL in _migrados:
+            return VERSAO_ATUAL
+        versao = migrar(db)
+        _migrados.add(db.DATABASE_URL)
+        return versao
@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Cliente HTTP compartilhado pelos coletores (NOAA, open-meteo, ipinfo):
+# uma Session com pool de conexões keep-alive, timeouts de conexão/leitura,
+# novas tentativas com espera exponencial e jitter, e limite de requisições
+# simultâneas por host.
+
+STATUS_REPETIVEIS = {429, 500, 502, 503, 504}
+
+
+class ClienteHTTP:
+    def __init__(self, timeout_conexao=5, timeout_leitura=30, tentativas=3,
+                 espera_base=0.5, espera_maxima=8, concorrencia_por_host=4):
+        self.timeout_conexao = timeout_conexao
+        self.timeout_leitura = timeout_leitura
+        self.tentativas = tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.concorrencia_por_host = concorrencia_por_host
+
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=10, pool_maxsize=concorrencia_por_host)
+        self.sessao.mount('https://', adaptador)
+        self.sessao.mount('http://', adaptador)
+
+        self._semaforos = {}
+        self._semaforos_lock = threading.Lock()
+
+    def _semaforo(self, url):
+        host = urlsplit(url).netloc
+        with self._semaforos_lock:
+            semaforo = self._semaforos.get(host)
+            if semaforo is None:
+                semaforo = threading.BoundedSemaphore(self.concorrencia_por_host)
+                self._semaforos[host] = semaforo
+            return semaforo
+
+    def _espera(self, tentativa, resposta=None):
+        if resposta is not None and resposta.headers.get('Retry-After', '').isdigit():
+            return min(float(resposta.headers['Retry-After']), self.espera_maxima)
+        # "Full jitter": sorteia entre 0 e o teto exponencial da tentativa.
+        teto = min(self.espera_maxima, self.espera_base * (2 ** tentativa))
+        return random.uniform(0, teto)
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        """
+        GET com novas tentativas em falhas de rede e nos STATUS_REPETIVEIS.
+        Retorna a última resposta obtida (o chamador trata o status) ou
+        relança a última exceção de rede se nenhuma resposta chegou.
+        """
+        timeout = timeout or (self.timeout_conexao, self.timeout_leitura)
+        for tentativa in range(self.tentativas + 1):
+            resposta = None
+            erro = None
+            with self._semaforo(url):
+                try:
+                    resposta = self.sessao.get(url, params=params, headers=headers, timeout=timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    erro = e
+
+            if resposta is not None and resposta.status_code not in STATUS_REPETIVEIS:
+                return resposta
+            if tentativa == self.tentativas:
+                if resposta is not None:
+                    return resposta
+                raise erro
+
+            espera = self._espera(tentativa, resposta)
+            motivo = f"status {resposta.status_code}" if resposta is not None else erro
+            print(f"Falha ao acessar {url} ({motivo}); nova tentativa em {espera:.1f}s.")
+            time.sleep(espera)
+
+    def fechar(self):
+        self.sessao.close()
+
+
+_padrao = None
+_padrao_lock = threading.Lock()
+
+
+def cliente():
+    """O ClienteHTTP compartilhado pelo processo."""
+    global _padrao
+    with _padrao_lock:
+        if _padrao is None:
+            _padrao = ClienteHTTP()
+        return _padrao
+
+
+def configurar(**opcoes):
+    """Substitui o cliente compartilhado por um com outras opções (timeouts, tentativas...)."""
+    global _padrao
+    with _padrao_lock:
+        if _padrao is not None:
+            _padrao.fechar()
+        _padrao = ClienteHTTP(**opcoes)
+        return _padrao
+
+
+def get(url, params=None, headers=None, timeout=None):
+    return cliente().get(url, params=params, headers=headers, timeout=timeout)
@@ -1,15 +1,25 @@
-import requests
+import json
+import os
+import cache_http
+
+# Base do serviço do NOAA; NOAA_URL_BASE aponta para outro servidor (p.ex. o stub local de benchmarks/).
+URL_BASE = os.environ.get('NOAA_URL_BASE', 'https://services.swpc.noaa.gov')
+CAMINHO_KP_1M = '/json/planetary_k_index_1m.json'
 
 class IndiceKP:
-    def __init__(self):
+    def __init__(self, url_base=None):
+        self.url_base = url_base
         self.data = None
-    def get_data(self):
+        # False quando o NOAA não publicou nada desde a última busca (304 ou cache ainda válido).
+        self.modificado = None
+    def get_data(self, revalidar=False):
         if self.data is None:
-            response = requests.get("https://services.swpc.noaa.gov/json/planetary_k_index_1m.json")
-            if response.status_code == 200:
-                self.data = response.json()
+            status, corpo, self.modificado = cache_http.buscar(
+                (self.url_base or URL_BASE) + CAMINHO_KP_1M, revalidar=revalidar
+            )
+            if status in (200, 304):
+                self.data = json.loads(corpo)
             else:
-                print(f"Error: {response.text}")
-                raise Exception(f"Failed to fetch data: {response.status_code}")
+                print(f"Error: {corpo.decode('utf-8', errors='replace')}")
+                raise Exception(f"Failed to fetch data: {status}")
         return self.data
-    
\ No newline at end of file
@@ -1,18 +1,24 @@
 import tkinter as tk
 from tkinter import ttk
 import json
-from datetime import datetime
-from banco import meusqldb
+import sys
+import queue
+import threading
+from datetime import datetime, timedelta
+import config
+import agregados
 from clima import climinha
 from dados_dispo import dispositivo
 from indice_kp import IndiceKP
-import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
-from main import main
+import matplotlib.dates as mdates
+from main import main, IDENTIFICADOR_LOCAL
 
 class Interface:
-    def __init__(self, root):
+    def __init__(self, root, coletar=True):
+        # Com coletar=False a interface só lê o banco (a ingestão fica com o agendador.py).
+        self.coletar = coletar
         self.root = root
         self.root.title("Sistema de Monitoramento")
         self.root.geometry("1400x900")
@@ -34,6 +40,17 @@ class Interface:
         self.create_clima_tab()
         self.create_dispositivo_tab()
         self.create_kp_tab()
+
+        self.status_label = ttk.Label(root, text="", background="#f0f0f0")
+        self.status_label.pack(anchor='w', padx=20, pady=(0, 10))
+
+        self.fila_resultados = queue.Queue()
+        self.geracao = 0
+        self.cancelar_atual = None
+        # Só uma coleta por vez: uma atualização cancelada não interrompe a coleta já iniciada.
+        self.coleta_lock = threading.Lock()
+        self.agendamento = None
+        self.verificar_fila()
         
         self.update_data()
         
@@ -75,6 +92,14 @@ class Interface:
         self.ax_temp = self.fig_temp.add_subplot(111)
         self.canvas_temp = FigureCanvasTkAgg(self.fig_temp, master=data_frame)
         self.canvas_temp.get_tk_widget().pack(side='left', fill='both', expand=True)
+
+        # A linha é criada uma vez e só recebe novos dados a cada atualização.
+        self.linha_temp, = self.ax_temp.plot([], [], 'b-')
+        self.ax_temp.xaxis_date()
+        self.ax_temp.set_title('Temperatura nas últimas 24 horas')
+        self.ax_temp.set_xlabel('Hora')
+        self.ax_temp.set_ylabel('Temperatura (°C)')
+        self.ax_temp.grid(True)
         
         table_frame = ttk.Frame(data_frame)
         table_frame.pack(side='right', fill='both', expand=True, padx=10)
@@ -134,6 +159,17 @@ class Interface:
         self.ax_kp = self.fig_kp.add_subplot(111)
         self.canvas_kp = FigureCanvasTkAgg(self.fig_kp, master=data_frame)
         self.canvas_kp.get_tk_widget().pack(side='left', fill='both', expand=True)
+
+        self.linha_kp_hist, = self.ax_kp.plot([], [], 'b-', label='Histórico', linewidth=2)
+        self.linha_kp_prev, = self.ax_kp.plot([], [], 'r--', label='Previsão', linewidth=2)
+        self.ax_kp.xaxis_date()
+        self.ax_kp.set_title('Índice Kp - Histórico e Previsão', pad=20)
+        self.ax_kp.set_xlabel('Data/Hora')
+        self.ax_kp.set_ylabel('Índice Kp')
+        self.ax_kp.grid(True, linestyle='--', alpha=0.7)
+        self.ax_kp.legend(loc='upper right')
+        self.ax_kp.tick_params(axis='x', labelrotation=45)
+        self.fig_kp.tight_layout()
         
         tables_frame = ttk.Frame(data_frame)
         tables_frame.pack(side='right', fill='both', expand=True, padx=10)
@@ -177,20 +213,139 @@ class Interface:
         scrollbar_prev.pack(side='right', fill='y')
         
     def update_data(self):
-        insta_main = main()
-        insta_main.main()
+        """
+        Dispara uma atualização numa thread de trabalho e volta logo para o
+        loop do Tk. Uma atualização ainda em andamento é cancelada: o
+        resultado dela é descartado ao chegar na fila e, se ainda não começou
+        a coleta, ela não começa.
+        """
+        if self.cancelar_atual is not None:
+            self.cancelar_atual.set()
+        self.geracao += 1
+        self.cancelar_atual = threading.Event()
+        self.status_label.config(text="Atualizando dados...")
 
+        worker = threading.Thread(
+            target=self.carregar_dados,
+            args=(self.geracao, self.cancelar_atual),
+            daemon=True
+        )
+        worker.start()
+
+        if self.agendamento is not None:
+            self.root.after_cancel(self.agendamento)
+        self.agendamento = self.root.after(300000, self.update_data)
+
+    def carregar_dados(self, geracao, cancelado):
+        # Roda fora da thread do Tk: só rede e banco, nada de widgets aqui.
         try:
-            conn = meusqldb('root', 'MinhaSenhaSegura', '127.0.0.1', '3306', 'Banco_geral')
-            
-            dados_dispo = conn.selecionar_dados('dispositivo', {'id': 1})
+            if self.coletar:
+                if self.coleta_lock.acquire(blocking=False):
+                    try:
+                        if not cancelado.is_set():
+                            insta_main = main()
+                            insta_main.main(paralelo=True)
+                    finally:
+                        self.coleta_lock.release()
+                else:
+                    # Outra atualização ainda está coletando: espera ela e só relê o banco.
+                    with self.coleta_lock:
+                        pass
+            if cancelado.is_set():
+                return
+
+            conn = config.conectar()
+            dados = {}
+            dados['dispositivo'] = conn.selecionar_dados('dispositivo', {'identificador': IDENTIFICADOR_LOCAL})
+
+            # Só o clima do dispositivo local; as estações da frota ficam de fora.
+            dados['clima'] = []
+            dados['serie_clima'] = []
+            if dados['dispositivo']:
+                local = dados['dispositivo'][0]
+                dados['clima'] = conn.selecionar_dados(
+                    'clima', {'device_id': local['id']}, ordenar_por='-hora', limite=24
+                )
+                dados['clima'].reverse()
+                fim = datetime.now()
+                _, dados['serie_clima'] = agregados.serie_clima(conn, fim - timedelta(hours=24), fim, dispositivo=local)
+            if cancelado.is_set():
+                return
+
+            agora = datetime.now()
+            dados['historicos'] = conn.selecionar_dados(
+                'kp_indices', {'time_tag': ('<=', agora)},
+                ordenar_por='-time_tag', limite=50
+            )
+            dados['historicos'].reverse()
+            dados['previsoes'] = conn.selecionar_dados(
+                'kp_indices', {'time_tag': ('>', agora)}, ordenar_por='time_tag'
+            )
+            self.fila_resultados.put((geracao, dados, None))
+        except Exception as e:
+            self.fila_resultados.put((geracao, None, e))
+
+    def verificar_fila(self):
+        try:
+            while True:
+                geracao, dados, erro = self.fila_resultados.get_nowait()
+                if geracao != self.geracao:
+                    continue
+                if erro is not None:
+                    print(f"Erro ao atualizar dados: {erro}")
+                    self.status_label.config(text=f"Erro ao atualizar dados: {erro}")
+                else:
+                    self.exibir_dados(dados)
+                    self.status_label.config(
+                        text=f"Atualizado às {datetime.now().strftime('%H:%M:%S')}"
+                    )
+        except queue.Empty:
+            pass
+        self.root.after(200, self.verificar_fila)
+
+    def sincronizar_tree(self, tree, linhas):
+        """
+        Atualiza a Treeview a partir de pares (iid, valores) na ordem de exibição:
+        remove o que saiu, insere só o que é novo e mexe nas linhas existentes
+        apenas se o valor ou a posição mudou.
+        """
+        desejados = {iid for iid, _ in linhas}
+        existentes = set(tree.get_children())
+        sair = existentes - desejados
+        if sair:
+            tree.delete(*sair)
+
+        atuais = list(tree.get_children())
+        for posicao, (iid, valores) in enumerate(linhas):
+            valores = tuple(str(valor) for valor in valores)
+            if iid in existentes:
+                if tuple(str(valor) for valor in tree.item(iid, 'values')) != valores:
+                    tree.item(iid, values=valores)
+                if posicao >= len(atuais) or atuais[posicao] != iid:
+                    tree.move(iid, '', posicao)
+                    atuais = list(tree.get_children())
+            else:
+                tree.insert('', posicao, iid=iid, values=valores)
+                atuais.insert(posicao, iid)
+
+    def atualizar_linha(self, linha, datas, valores):
+        """Troca os dados da linha; retorna False se nada mudou (sem redesenho)."""
+        x = mdates.date2num(datas) if datas else []
+        if list(linha.get_xdata()) == list(x) and list(linha.get_ydata()) == list(valores):
+            return False
+        linha.set_data(x, valores)
+        return True
+
+    def exibir_dados(self, dados):
+        try:
+            dados_dispo = dados['dispositivo']
             if dados_dispo:
-                self.dispo_tree.delete(*self.dispo_tree.get_children())
-                for key, value in dados_dispo[0].items():
-                    if key != 'id':
-                        self.dispo_tree.insert('', 'end', values=(key.capitalize(), value))
+                self.sincronizar_tree(self.dispo_tree, [
+                    (key, (key.capitalize(), value))
+                    for key, value in dados_dispo[0].items() if key != 'id'
+                ])
 
-            dados_clima = conn.selecionar_dados('clima')
+            dados_clima = dados['clima']
             if dados_clima:
                 ultimo_clima = dados_clima[-1]
                 self.temp_label.config(text=f"{ultimo_clima['temperatura']}°C")
@@ -199,94 +354,74 @@ class Interface:
                          f"Direção: {ultimo_clima['direcao_vent']}°"
                 )
                 
-                self.clima_tree.delete(*self.clima_tree.get_children())
-                for registro in reversed(dados_clima[-10:]):  
-                    data = registro['hora'].strftime("%d/%m/%Y %H:%M")
-                    self.clima_tree.insert('', 'end', values=(
-                        data,
+                self.sincronizar_tree(self.clima_tree, [
+                    (str(registro['id']), (
+                        registro['hora'].strftime("%d/%m/%Y %H:%M"),
                         f"{registro['temperatura']}°C",
                         f"{registro['velocidade_vent']} km/h",
                         f"{registro['direcao_vent']}°"
                     ))
+                    for registro in reversed(dados_clima[-10:])
+                ])
                 
-                self.ax_temp.clear()
-                datas = [r['hora'] for r in dados_clima[-24:]]  
-                temps = [r['temperatura'] for r in dados_clima[-24:]]
-                self.ax_temp.plot(datas, temps, 'b-')
-                self.ax_temp.set_title('Temperatura nas últimas 24 horas')
-                self.ax_temp.set_xlabel('Hora')
-                self.ax_temp.set_ylabel('Temperatura (°C)')
-                self.ax_temp.grid(True)
-                self.canvas_temp.draw()
+                serie = dados['serie_clima']
+                if self.atualizar_linha(
+                    self.linha_temp,
+                    [r['hora'] for r in serie],
+                    [r['temperatura'] for r in serie]
+                ):
+                    self.ax_temp.relim()
+                    self.ax_temp.autoscale_view()
+                    self.canvas_temp.draw_idle()
             
-            kp_indices = conn.selecionar_dados('kp_indices')
+            dados_historicos = dados['historicos']
+            previsoes = dados['previsoes']
+            kp_indices = dados_historicos + previsoes
             if kp_indices:
                 ultimo_kp = kp_indices[-1]
-                kp_value = self.convert_kp_value(ultimo_kp['kp'])
                 self.kp_label.config(
                     text=f"Valor: {ultimo_kp['kp']}\n"
                          f"Estimativa: {ultimo_kp['estimated_kp']}"
                 )
                 
-                agora = datetime.now()
-                dados_historicos = []
-                previsoes = []
-                
-                for registro in kp_indices:
-                    if registro['time_tag'] <= agora:
-                        dados_historicos.append(registro)
-                    else:
-                        previsoes.append(registro)
-                
-                self.kp_tree.delete(*self.kp_tree.get_children())
-                for registro in reversed(dados_historicos[-50:]):  
-                    data = registro['time_tag'].strftime("%d/%m/%Y %H:%M")
-                    self.kp_tree.insert('', 'end', values=(
-                        data,
+                self.sincronizar_tree(self.kp_tree, [
+                    (str(registro['id']), (
+                        registro['time_tag'].strftime("%d/%m/%Y %H:%M"),
                         registro['kp'],
                         f"{registro['estimated_kp']:.2f}"
                     ))
+                    for registro in reversed(dados_historicos[-50:])
+                ])
                 
-                self.kp_prev_tree.delete(*self.kp_prev_tree.get_children())
+                linhas_prev = []
                 for registro in previsoes:
-                    data = registro['time_tag'].strftime("%d/%m/%Y %H:%M")
                     confianca = "Alta" if registro['estimated_kp'] > 0.8 else "Média" if registro['estimated_kp'] > 0.5 else "Baixa"
-                    self.kp_prev_tree.insert('', 'end', values=(
-                        data,
+                    linhas_prev.append((str(registro['id']), (
+                        registro['time_tag'].strftime("%d/%m/%Y %H:%M"),
                         registro['kp'],
                         confianca
-                    ))
-                
-                self.ax_kp.clear()
-                
-                if dados_historicos:
-                    datas_hist = [r['time_tag'] for r in dados_historicos[-24:]]
-                    kps_hist = [self.convert_kp_value(r['kp']) for r in dados_historicos[-24:]]
-                    self.ax_kp.plot(datas_hist, kps_hist, 'b-', label='Histórico', linewidth=2)
+                    )))
+                self.sincronizar_tree(self.kp_prev_tree, linhas_prev)
                 
-                if previsoes:
-                    datas_prev = [r['time_tag'] for r in previsoes]
-                    kps_prev = [self.convert_kp_value(r['kp']) for r in previsoes]
-                    self.ax_kp.plot(datas_prev, kps_prev, 'r--', label='Previsão', linewidth=2)
-                
-                self.ax_kp.set_title('Índice Kp - Histórico e Previsão', pad=20)
-                self.ax_kp.set_xlabel('Data/Hora')
-                self.ax_kp.set_ylabel('Índice Kp')
-                self.ax_kp.grid(True, linestyle='--', alpha=0.7)
-                self.ax_kp.legend(loc='upper right')
-                
-                plt.setp(self.ax_kp.get_xticklabels(), rotation=45, ha='right')
-                
-                self.fig_kp.tight_layout()
-                
-                self.canvas_kp.draw()
+                mudou_hist = self.atualizar_linha(
+                    self.linha_kp_hist,
+                    [r['time_tag'] for r in dados_historicos[-24:]],
+                    [self.convert_kp_value(r['kp']) for r in dados_historicos[-24:]]
+                )
+                mudou_prev = self.atualizar_linha(
+                    self.linha_kp_prev,
+                    [r['time_tag'] for r in previsoes],
+                    [self.convert_kp_value(r['kp']) for r in previsoes]
+                )
+                if mudou_hist or mudou_prev:
+                    self.ax_kp.relim()
+                    self.ax_kp.autoscale_view()
+                    self.canvas_kp.draw_idle()
                 
         except Exception as e:
-            print(f"Erro ao atualizar dados: {e}")
-        
-        self.root.after(300000, self.update_data)
+            print(f"Erro ao exibir dados: {e}")
 
 if __name__ == "__main__":
     root = tk.Tk()
-    app = Interface(root)
+    app = Interface(root, coletar='--somente-leitura' not in sys.argv)
     root.mainloop()
\ No newline at end of file
@@ -1,159 +1,278 @@
-from indice_kp import IndiceKP as kp 
-from banco import meusqldb
+from indice_kp import IndiceKP as kp
+import config
+import esquema
+import agregados
 from dados_dispo import dispositivo
 from clima import climinha as clima
-from sqlalchemy import create_engine, inspect, Column, Integer, String, Float, DateTime, MetaData, Table
-from datetime import datetime
-
-USER = 'root'
-PASSWORD = 'MinhaSenhaSegura'
-HOST = '127.0.0.1'
-PORT = '3306'
-DB_NAME = 'Banco_geral'
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import sys
+
+# Identificador do dispositivo onde o coletor roda; o id vem do banco, porque
+# as estações da frota também recebem ids autoincrementais.
+IDENTIFICADOR_LOCAL = 'local'
+
+# Janela relida antes da marca d'água para aplicar revisões tardias do NOAA.
+SOBREPOSICAO_KP = timedelta(hours=1)
 class main:
     def formatar_dados(self,dados):
         for item in dados:
             item['time_tag'] = datetime.fromisoformat(item['time_tag'])
         return dados
 
-    def inserir_incice_kp(self):
-        conn = meusqldb(USER, PASSWORD, HOST, PORT, DB_NAME)
-        tabelas = conn.verifica_tabelas()
-        
-        if 'kp_indices' not in tabelas:
-            colunas = [
-                Column('id', Integer, primary_key=True, autoincrement=True),
-                Column('time_tag', DateTime, nullable=False),
-                Column('kp_index', Integer, nullable=False),
-                Column('estimated_kp', Float, nullable=False),
-                Column('kp', String(10), nullable=False)
-            ]
-
-            conn.criar_tabela_generica('kp_indices', colunas)
-        else:
-            print("Tabela 'kp_indices' já existe.")
-
+    # --- Coleta (só rede) ---
+    def buscar_kp(self, revalidar=False):
+        """
+        Dados do feed já formatados, ou None se o NOAA não publicou nada novo.
+        `revalidar` consulta o NOAA (GET condicional) mesmo com o cache HTTP no TTL.
+        """
         claskp = kp()
-        dados = claskp.get_data()
-        dados_banco = conn.selecionar_dados('kp_indices')
-        dados_formatados = self.formatar_dados(dados)
-        atualizados = []
-        inseridor = []
-
-        if dados_banco:
-            time_tags_banco = {dado['time_tag'] for dado in dados_banco}
-            
-            for dado_formatado in dados_formatados:
-                if dado_formatado['time_tag'] in time_tags_banco:
-                    conn.atualizar_dados('kp_indices', {'time_tag': dado_formatado['time_tag']}, dado_formatado)
-                    atualizados.append(dado_formatado)
-                else:
-                    conn.inserir_dados('kp_indices', [dado_formatado])
-                    inseridor.append(dado_formatado)
-        else:
-            conn.inserir_dados('kp_indices', dados_formatados)
+        dados = claskp.get_data(revalidar)
+        if not claskp.modificado:
+            return None
+        return self.formatar_dados(dados)
 
-        print("Total registros atualizados:", len(atualizados))
-        print("Total registros inseridos:", len(inseridor))
-        print("Total registros:", len(dados_formatados))
-        
-    def inserir_dados_dispositivo(self):
-        conn = meusqldb(USER, PASSWORD, HOST, PORT, DB_NAME)
-        tabelas = conn.verifica_tabelas()
+    def buscar_dispositivo(self):
+        """Retorna (dados para a tabela dispositivo, se mudaram desde a última busca)."""
         dados_dispo = dispositivo()
         dados = dados_dispo.get_dados()
-        
-        if 'dispositivo' not in tabelas:
-            colunas = [
-                Column('id', Integer, primary_key=True, autoincrement=True),
-                Column('ip', String(50)),
-                Column('hostname', String(100)),
-                Column('city', String(50)),
-                Column('region', String(50)),
-                Column('country', String(10)),
-                Column('longitude', String(50)),
-                Column('latitude', String(50)),
-                Column('org', String(100)),
-                Column('postal', String(20)),
-                Column('timezone', String(50))
-            ]
-
-            conn.criar_tabela_generica('dispositivo', colunas)
-            conn.inserir_dados('dispositivo', dados)
-        else:
-            print("Tabela 'dispositivo' já existe.")
-            print("Atualizando dados do dispositivo...")
-            filtro = {'id': 1}
-            novos_dados = {
-                'ip': dados.get('ip'),
-                'hostname': dados.get('hostname'),
-                'city': dados.get('city'),
-                'region': dados.get('region'),
-                'country': dados.get('country'),
-                'longitude': dados.get('longitude'),
-                'latitude': dados.get('latitude'),
-                'org': dados.get('org'),
-                'postal': dados.get('postal'),
-                'timezone': dados.get('timezone')
-            }
-            conn.atualizar_dados('dispositivo', filtro, novos_dados)
-            print("Dados do dispositivo atualizados com sucesso.")
-
-        print("Dados de dispositivo inseridos com sucesso.")
-    def inserir_clima(self):
-        conn = meusqldb(USER, PASSWORD, HOST, PORT, DB_NAME)
-        tabelas = conn.verifica_tabelas()
-        
-        if 'clima' not in tabelas:
-            colunas = [
-                Column('id', Integer, primary_key=True, autoincrement=True),
-                Column('hora', DateTime, nullable=False),
-                Column('temperatura', Float, nullable=False),
-                Column('velocidade_vent', Float, nullable=False),
-                Column('direcao_vent', Float, nullable=False),
-                Column('latitude', Float, nullable=False),
-                Column('longitude', Float, nullable=False)
-            ]
-
-            conn.criar_tabela_generica('clima', colunas)
-        else:
-            print("Tabela 'clima' já existe.")
+        return {
+            'ip': dados.get('ip'),
+            'hostname': dados.get('hostname'),
+            'city': dados.get('city'),
+            'region': dados.get('region'),
+            'country': dados.get('country'),
+            'longitude': dados.get('longitude'),
+            'latitude': dados.get('latitude'),
+            'org': dados.get('org'),
+            'postal': dados.get('postal'),
+            'timezone': dados.get('timezone'),
+            'identificador': IDENTIFICADOR_LOCAL
+        }, dados_dispo.alterado
 
-        self.inserir_dados_dispositivo()
-        banco_dispo = conn.selecionar_dados('dispositivo', {'id': 1})
-        if not banco_dispo:
-            print("Nenhum dado de dispositivo encontrado. Inserindo dados de dispositivo primeiro.")
-        dados_clima = clima(banco_dispo[0]['longitude'], banco_dispo[0]['latitude'])
+    def buscar_clima(self, latitude, longitude, device_id=None):
+        dados_clima = clima(longitude, latitude)
         dados = dados_clima.get_clima()
+        return self.formatar_clima(dados, latitude, longitude, device_id)
+
+    def buscar_clima_lote(self, locais):
+        """Clima de vários locais [(latitude, longitude), ...] em poucas requisições; ignora os que falharem."""
+        respostas = clima.get_clima_lote([(longitude, latitude) for latitude, longitude in locais])
+        return [
+            self.formatar_clima(dados, latitude, longitude)
+            for (latitude, longitude), dados in zip(locais, respostas)
+            if dados is not None
+        ]
+
+    def buscar_clima_frota(self, dispositivos, max_concorrencia=4, tamanho_lote=100):
+        """Clima de cada dispositivo ({'id', 'latitude', 'longitude'}), em lotes buscados em paralelo."""
+        respostas = clima.get_clima_lote(
+            [(d['longitude'], d['latitude']) for d in dispositivos],
+            tamanho_lote=tamanho_lote,
+            max_concorrencia=max_concorrencia
+        )
+        return [
+            self.formatar_clima(dados, d['latitude'], d['longitude'], d['id'])
+            for d, dados in zip(dispositivos, respostas)
+            if dados is not None
+        ]
+
+    def formatar_clima(self, dados, latitude, longitude, device_id=None):
         temperatura = dados['current_weather']['temperature']
         velocidade_vent = dados['current_weather']['windspeed']
         direcao_vent = dados['current_weather']['winddirection']
         hora = datetime.fromisoformat(dados['current_weather']['time'])
-        dados_formatados = {
+        return {
             'hora': hora,
             'temperatura': temperatura,
             'velocidade_vent': velocidade_vent,
             'direcao_vent': direcao_vent,
-            'latitude': banco_dispo[0]['latitude'],
-            'longitude': banco_dispo[0]['longitude']
+            'latitude': latitude,
+            'longitude': longitude,
+            'device_id': device_id
         }
+
+    def buscar_dispositivo_e_clima(self):
+        # O clima depende da localização do dispositivo, então as duas buscas são encadeadas.
+        dados_dispo, alterado = self.buscar_dispositivo()
+        # O device_id só é conhecido depois de gravar o dispositivo (ver pipeline).
+        return dados_dispo, alterado, self.buscar_clima(dados_dispo['latitude'], dados_dispo['longitude'])
+
+    # --- Gravação (só banco) ---
+    def gravar_kp(self, conn, dados_formatados, incremental=True):
+        total_feed = len(dados_formatados)
+
+        if incremental:
+            marca_dagua = conn.ler_marca_dagua('noaa_kp_1m', 'kp_indices', 'time_tag')
+            if marca_dagua is not None:
+                corte = marca_dagua - SOBREPOSICAO_KP
+                dados_formatados = [dado for dado in dados_formatados if dado['time_tag'] >= corte]
+
+        afetados = conn.upsert_dados('kp_indices', dados_formatados, chaves=('time_tag',))
+        if dados_formatados:
+            agregados.atualizar_rollups_kp(
+                conn,
+                min(dado['time_tag'] for dado in dados_formatados),
+                max(dado['time_tag'] for dado in dados_formatados)
+            )
+
+        if incremental and dados_formatados:
+            nova_marca = max(dado['time_tag'] for dado in dados_formatados)
+            if marca_dagua is None or nova_marca > marca_dagua:
+                conn.gravar_marca_dagua('noaa_kp_1m', nova_marca)
+
+        print("Total registros afetados:", afetados)
+        print("Total registros considerados:", len(dados_formatados))
+        print("Total registros no feed:", total_feed)
+
+    def dispositivo_local(self, conn):
+        """A linha do dispositivo local na tabela dispositivo, ou None se ainda não foi gravada."""
+        registros = conn.selecionar_dados('dispositivo', {'identificador': IDENTIFICADOR_LOCAL})
+        return registros[0] if registros else None
+
+    def gravar_dispositivo(self, conn, novos_dados, alterado=True):
+        """Grava o dispositivo local pelo identificador e retorna o id dele."""
+        local = self.dispositivo_local(conn)
+        if not alterado and local:
+            print("Localização do dispositivo sem mudanças; nada a atualizar.")
+            return local['id']
+        print("Atualizando dados do dispositivo...")
+        conn.upsert_dados('dispositivo', novos_dados, chaves=('identificador',))
+        print("Dados de dispositivo inseridos com sucesso.")
+        return self.dispositivo_local(conn)['id']
+
+    def gravar_clima(self, conn, dados_formatados):
         conn.inserir_dados('clima', dados_formatados)
+        agregados.atualizar_rollups_clima(conn, dados_formatados['hora'], dados_formatados['hora'])
         print("Dados climáticos inseridos com sucesso.")
-    def main(self):
-        conn = meusqldb(USER, PASSWORD, HOST, PORT, DB_NAME)
+
+    def gravar_clima_lote(self, conn, lista_dados):
+        if not lista_dados:
+            return
+        conn.inserir_dados('clima', lista_dados)
+        agregados.atualizar_rollups_clima(
+            conn,
+            min(dados['hora'] for dados in lista_dados),
+            max(dados['hora'] for dados in lista_dados)
+        )
+        print(f"{len(lista_dados)} registros climáticos inseridos com sucesso.")
+
+    # --- Etapas completas (coleta + gravação) ---
+    def inserir_incice_kp(self, incremental=True, revalidar=False):
+        conn = config.conectar()
+        esquema.garantir_esquema(conn)
+
+        dados_formatados = self.buscar_kp(revalidar)
+        if dados_formatados is None:
+            print("Feed do índice Kp sem novidades desde a última busca; nada a inserir.")
+            return
+        self.gravar_kp(conn, dados_formatados, incremental)
+
+    def inserir_dados_dispositivo(self):
+        conn = config.conectar()
+        esquema.garantir_esquema(conn)
+        self.gravar_dispositivo(conn, *self.buscar_dispositivo())
+
+    def inserir_clima(self):
+        conn = config.conectar()
+        esquema.garantir_esquema(conn)
+
+        self.inserir_dados_dispositivo()
+        local = self.dispositivo_local(conn)
+        dados_formatados = self.buscar_clima(local['latitude'], local['longitude'], local['id'])
+        self.gravar_clima(conn, dados_formatados)
+
+    def inserir_clima_lote(self, locais):
+        conn = config.conectar()
+        esquema.garantir_esquema(conn)
+        self.gravar_clima_lote(conn, self.buscar_clima_lote(locais))
+
+    def registrar_dispositivos(self, dispositivos):
+        """
+        Cadastra/atualiza estações da frota pelo `identificador`. Cada item é um
+        dict com 'identificador', 'latitude', 'longitude' e, opcionalmente,
+        'ativo' e os demais campos da tabela dispositivo. Um campo omitido
+        fica com o default numa estação nova (ativo=True) e não é alterado
+        numa estação já cadastrada.
+        """
+        conn = config.conectar()
+        esquema.garantir_esquema(conn)
+        conn.upsert_dados('dispositivo', dispositivos, chaves=('identificador',))
+
+    def ciclo_frota(self, max_concorrencia=4, tamanho_lote=100):
+        """
+        Um ciclo de clima para todos os dispositivos ativos: as coordenadas vão
+        em lotes de `tamanho_lote` por requisição, até `max_concorrencia`
+        requisições simultâneas, e tudo é gravado num único insert em lote.
+        Entram só as estações cadastradas por identificador; o dispositivo local
+        fica de fora, porque o clima dele já é gravado por inserir_clima.
+        """
+        conn = config.conectar()
+        esquema.garantir_esquema(conn)
+        dispositivos = conn.selecionar_dados(
+            'dispositivo', {'ativo': True, 'identificador': ('!=', IDENTIFICADOR_LOCAL)},
+            colunas=['id', 'latitude', 'longitude']
+        )
+        dispositivos = [d for d in dispositivos if d['latitude'] is not None and d['longitude'] is not None]
+        lista_dados = self.buscar_clima_frota(dispositivos, max_concorrencia, tamanho_lote)
+        self.gravar_clima_lote(conn, lista_dados)
+        print(f"Ciclo da frota: {len(lista_dados)} de {len(dispositivos)} dispositivos com clima gravado.")
+        return len(lista_dados)
+
+    def pipeline(self):
+        """
+        Busca NOAA e ipinfo→open-meteo em paralelo e grava cada resultado assim
+        que chega, numa etapa separada na thread principal. Se uma fonte falhar,
+        as outras ainda são gravadas e o primeiro erro é relançado no fim.
+        """
+        conn = config.conectar()
+        esquema.garantir_esquema(conn)
+
+        erros = []
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futuros = {
+                executor.submit(self.buscar_kp): 'kp',
+                executor.submit(self.buscar_dispositivo_e_clima): 'clima'
+            }
+            for futuro in as_completed(futuros):
+                fonte = futuros[futuro]
+                try:
+                    resultado = futuro.result()
+                    if fonte == 'kp':
+                        if resultado is None:
+                            print("Feed do índice Kp sem novidades desde a última busca; nada a inserir.")
+                        else:
+                            self.gravar_kp(conn, resultado)
+                    else:
+                        dados_dispo, alterado, dados_clima = resultado
+                        dados_clima['device_id'] = self.gravar_dispositivo(conn, dados_dispo, alterado)
+                        self.gravar_clima(conn, dados_clima)
+                except Exception as e:
+                    print(f"Erro na fonte '{fonte}': {e}")
+                    erros.append(e)
+
+        if erros:
+            raise erros[0]
+
+    def main(self, paralelo=False):
+        conn = config.conectar()
         existe = conn.criar_banco()
         if not existe:
             print("Erro ao criar o banco de dados.")
             return
+        esquema.garantir_esquema(conn)
         tabelas= conn.verifica_tabelas()
 
         print("Tabelas disponíveis:")
         for tabela in tabelas:
             print(tabela)
 
-        self.inserir_incice_kp()
-        self.inserir_clima()
+        if paralelo:
+            self.pipeline()
+        else:
+            self.inserir_incice_kp()
+            self.inserir_clima()
 
 if __name__ == "__main__":
     main_instance = main()
-    main_instance.main()
\ No newline at end of file
+    main_instance.main(paralelo='--paralelo' in sys.argv)
@@ -0,0 +1,181 @@
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, inspect, text
+
+import agregados
+import config
+import esquema
+
+# Retenção do kp_indices. No MySQL a tabela é particionada por mês (RANGE em
+# TO_DAYS(time_tag)): consultas por período só leem as partições do período
+# e descartar um mês antigo é um DROP PARTITION. Nos outros bancos o mesmo
+# mês é apagado por faixa de time_tag, usando o índice único da coluna.
+# Antes de descartar, os resumos por hora/dia do mês são recalculados e o
+# mês vai para o arquivo em Parquet (arquivo.py).
+
+MESES_A_FRENTE = 3
+PARTICAO_FUTURO = 'pfuturo'
+
+
+def inicio_do_mes(momento):
+    return datetime(momento.year, momento.month, 1)
+
+
+def proximo_mes(mes):
+    return datetime(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def _nome_particao(mes):
+    return f"p{mes:%Y%m}"
+
+
+def _definicao_particao(mes):
+    return f"PARTITION {_nome_particao(mes)} VALUES LESS THAN (TO_DAYS('{proximo_mes(mes):%Y-%m-%d}'))"
+
+
+def meses_entre(inicio, fim):
+    mes = inicio_do_mes(inicio)
+    while mes < fim:
+        yield mes
+        mes = proximo_mes(mes)
+
+
+def particoes_kp(db):
+    """{início do mês: nome da partição} do kp_indices; vazio se a tabela não for particionada."""
+    engine = db.cria_engine()
+    if engine.dialect.name != 'mysql':
+        return {}
+    with engine.connect() as conn:
+        nomes = conn.execute(text(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'kp_indices' AND PARTITION_NAME IS NOT NULL"
+        )).scalars()
+        return {
+            datetime.strptime(nome[1:], '%Y%m'): nome
+            for nome in nomes if nome != PARTICAO_FUTURO
+        }
+
+
+def particionar_kp(db, meses_a_frente=MESES_A_FRENTE):
+    """Converte o kp_indices do MySQL em partições mensais. Não faz nada se já for particionado."""
+    engine = db.cria_engine()
+    if engine.dialect.name != 'mysql' or particoes_kp(db):
+        return False
+
+    tabela = db.tabela('kp_indices')
+    with engine.connect() as conn:
+        primeiro = conn.execute(select(func.min(tabela.c.time_tag))).scalar()
+    agora = datetime.now()
+    fim = inicio_do_mes(agora)
+    for _ in range(meses_a_frente + 1):
+        fim = proximo_mes(fim)
+    definicoes = [_definicao_particao(mes) for mes in meses_entre(primeiro or agora, fim)]
+    definicoes.append(f"PARTITION {PARTICAO_FUTURO} VALUES LESS THAN MAXVALUE")
+
+    chave_primaria = inspect(engine).get_pk_constraint('kp_indices')['constrained_columns']
+    with engine.begin() as conn:
+        if 'time_tag' not in chave_primaria:
+            # Toda chave única de uma tabela particionada precisa conter a coluna de partição.
+            conn.execute(text("ALTER TABLE kp_indices DROP PRIMARY KEY, ADD PRIMARY KEY (id, time_tag)"))
+        conn.execute(text(
+            f"ALTER TABLE kp_indices PARTITION BY RANGE (TO_DAYS(time_tag)) ({', '.join(definicoes)})"
+        ))
+    db.invalidar_cache('kp_indices')
+    print(f"kp_indices particionado em {len(definicoes) - 1} meses.")
+    return True
+
+
+def garantir_particoes(db, meses_a_frente=MESES_A_FRENTE):
+    """Abre as partições dos próximos meses, dividindo a partição final (vazia)."""
+    particoes = particoes_kp(db)
+    if not particoes:
+        return 0
+    fim = inicio_do_mes(datetime.now())
+    for _ in range(meses_a_frente + 1):
+        fim = proximo_mes(fim)
+    novas = list(meses_entre(proximo_mes(max(particoes)), fim))
+    if not novas:
+        return 0
+    definicoes = [_definicao_particao(mes) for mes in novas]
+    definicoes.append(f"PARTITION {PARTICAO_FUTURO} VALUES LESS THAN MAXVALUE")
+    with db.cria_engine().begin() as conn:
+        conn.execute(text(
+            f"ALTER TABLE kp_indices REORGANIZE PARTITION {PARTICAO_FUTURO} INTO ({', '.join(definicoes)})"
+        ))
+    print(f"{len(novas)} partições novas em kp_indices.")
+    return len(novas)
+
+
+def aplicar_retencao(db, retencao=None, agora=None, arquivar=True):
+    """
+    Descarta do kp_indices os meses inteiros mais antigos que retencao['bruto'],
+    depois de recalcular os resumos desses meses (e, com `arquivar`, de
+    exportá-los para o arquivo em Parquet), e apaga do kp_horario o que
+    passou de retencao['hora']. Retorna os meses descartados.
+    """
+    import arquivo
+
+    retencao = {**agregados.RETENCAO_KP, **(retencao or {})}
+    agora = agora or datetime.now()
+    engine = db.cria_engine()
+    tabela = db.tabela('kp_indices')
+    descartados = []
+
+    if retencao['bruto'] is not None:
+        corte = inicio_do_mes(agora - retencao['bruto'])
+        with engine.connect() as conn:
+            primeiro = conn.execute(select(func.min(tabela.c.time_tag))).scalar()
+        particoes = particoes_kp(db)
+        meses = set(meses_entre(primeiro, corte)) if primeiro is not None and primeiro < corte else set()
+        meses.update(mes for mes in particoes if mes < corte)
+
+        for mes in sorted(meses):
+            fim_mes = proximo_mes(mes)
+            agregados.atualizar_rollups_kp(db, mes, fim_mes - timedelta(microseconds=1))
+            # Reexporta mesmo meses já arquivados: o mês pode ter recebido
+            # linhas (backfill) depois da exportação, e o arquivo é mesclado.
+            if arquivar:
+                arquivo.exportar_mes(db, 'kp_indices', mes)
+            with engine.begin() as conn:
+                if mes in particoes:
+                    conn.execute(text(f"ALTER TABLE kp_indices DROP PARTITION {particoes[mes]}"))
+                else:
+                    conn.execute(tabela.delete().where(tabela.c.time_tag >= mes, tabela.c.time_tag < fim_mes))
+            descartados.append(mes)
+            print(f"kp_indices: mês {mes:%Y-%m} resumido e descartado.")
+
+    if retencao['hora'] is not None:
+        horario = db.tabela('kp_horario')
+        with engine.begin() as conn:
+            conn.execute(horario.delete().where(horario.c.time_tag < agora - retencao['hora']))
+    return descartados
+
+
+def manutencao(db=None):
+    """Tarefa periódica: partições dos próximos meses, arquivo dos meses fechados e retenção."""
+    import arquivo
+
+    db = db or config.conectar()
+    esquema.garantir_esquema(db)
+    garantir_particoes(db)
+    for nome_tabela in arquivo.COLUNAS_TEMPO:
+        arquivo.exportar_fechados(db, nome_tabela)
+    return aplicar_retencao(db)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partições e retenção do kp_indices.")
+    parser.add_argument('--dias-bruto', type=float, help="dias de kp_indices por minuto a manter")
+    parser.add_argument('--dias-horario', type=float, help="dias de kp_horario a manter")
+    args = parser.parse_args()
+
+    conn = config.conectar()
+    conn.criar_banco()
+    esquema.garantir_esquema(conn)
+    garantir_particoes(conn)
+    retencao = {}
+    if args.dias_bruto is not None:
+        retencao['bruto'] = timedelta(days=args.dias_bruto)
+    if args.dias_horario is not None:
+        retencao['hora'] = timedelta(days=args.dias_horario)
+    aplicar_retencao(conn, retencao)
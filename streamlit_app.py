@@ -3,7 +3,8 @@ import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime
-from banco import meusqldb
+import config
+import consultas
 from main import main as main_outra
 
 # --- Configuração da Página ---
@@ -42,35 +43,54 @@ st.markdown("""
 
 # --- Funções de Apoio ---
 @st.cache_data(ttl=300)
-def get_and_prepare_data():
-    """Busca e prepara os dados do banco."""
+def get_date_bounds():
+    """Busca a primeira e a última data com registros históricos."""
     try:
-        conn = meusqldb('root', 'MinhaSenhaSegura', '127.0.0.1', '3306', 'Banco_geral')
-        kp_indices = conn.selecionar_dados('kp_indices')
-        
-        if not kp_indices:
+        conn = config.conectar()
+        # O kp_diario guarda todo o histórico; o kp_indices só os meses recentes.
+        primeiro = conn.selecionar_dados('kp_diario', colunas=['time_tag'], ordenar_por='time_tag', limite=1)
+        ultimo = conn.selecionar_dados(
+            'kp_indices', {'time_tag': ('<=', datetime.now())},
+            colunas=['time_tag'], ordenar_por='-time_tag', limite=1
+        )
+        if not primeiro or not ultimo:
             return None, None
-
-        df = pd.DataFrame(kp_indices)
-        df['time_tag'] = pd.to_datetime(df['time_tag'])
-        
-        def get_kp_level(kp_index):
-            if kp_index <= 2: return "Calmo"
-            if kp_index == 3: return "Instável"
-            if kp_index == 4: return "Ativo"
-            return "Tempestade"
-            
-        df['kp_level'] = df['kp_index'].apply(get_kp_level)
-        
-        now = datetime.now()
-        df_hist = df[df['time_tag'] <= now].copy()
-        df_prev = df[df['time_tag'] > now].copy()
-        
-        return df_hist, df_prev
+        return primeiro[0]['time_tag'].date(), ultimo[0]['time_tag'].date()
     except Exception as e:
         st.error(f"Erro ao buscar dados: {e}")
         return None, None
 
+@st.cache_data(ttl=300)
+def get_and_prepare_data(start_datetime, end_datetime):
+    """
+    Busca só o período pedido (e as previsões) e prepara os dados.
+    Períodos longos vêm dos resumos por hora/dia, sem kp_index/kp_level;
+    os curtos vêm por minuto, do arquivo em Parquet e do banco.
+    """
+    try:
+        conn = config.conectar()
+        resolution, df_hist, df_prev = consultas.periodo_kp(conn, start_datetime, end_datetime)
+        if df_hist.empty:
+            return None, None, None
+        return resolution, df_hist, df_prev
+    except Exception as e:
+        st.error(f"Erro ao buscar dados: {e}")
+        return None, None, None
+
+@st.cache_data(ttl=300)
+def get_kp_aggregates(start_datetime, end_datetime, levels=None):
+    """Resumo, distribuição por nível e registros mais recentes (do banco e, para períodos antigos, do arquivo)."""
+    conn = config.conectar()
+    end_datetime = min(end_datetime, datetime.now())
+    summary = consultas.resumo_kp(conn, start_datetime, end_datetime, levels)
+    level_counts = consultas.distribuicao_niveis(conn, start_datetime, end_datetime, levels)
+    recent_df = pd.DataFrame(
+        consultas.recentes_kp(conn, start_datetime, end_datetime, levels, limite=10),
+        columns=['time_tag', 'estimated_kp', 'kp_index', 'kp_level']
+    )
+    recent_df['time_tag'] = pd.to_datetime(recent_df['time_tag'])
+    return summary, level_counts, recent_df
+
 def handle_data_update():
     """
     Função callback para ser executada ao clicar no botão.
@@ -79,7 +99,7 @@ def handle_data_update():
     try:
         with st.spinner("Buscando novos dados das APIs..."):
             main_instance = main_outra()
-            main_instance.main()
+            main_instance.main(paralelo=True)
         st.cache_data.clear()
         st.session_state.update_message = {
             "type": "success", 
@@ -145,10 +165,10 @@ def main():
             st.error(message["text"])
         del st.session_state.update_message
 
-    # --- Carregar Dados ---
-    df_hist, df_prev = get_and_prepare_data()
+    # --- Carregar Limites de Datas ---
+    min_date, max_date = get_date_bounds()
 
-    if df_hist is None or df_hist.empty:
+    if min_date is None:
         st.warning("Nenhum dado histórico encontrado.")
         if st.button("Buscar dados na fonte"):
             with st.spinner("Atualizando..."):
@@ -161,9 +181,6 @@ def main():
     # --- Barra Lateral com Filtros ---
     st.sidebar.header("Filtros do Dashboard")
 
-    min_date = df_hist['time_tag'].min().date()
-    max_date = df_hist['time_tag'].max().date()
-
     date_range = st.sidebar.date_input(
         "Selecione o Período",
         value=(min_date, max_date),
@@ -178,8 +195,16 @@ def main():
 
     start_datetime = datetime.combine(date_range[0], datetime.min.time())
     end_datetime = datetime.combine(date_range[1], datetime.max.time())
+
+    # --- Carregar Dados do Período ---
+    resolution, df_hist, df_prev = get_and_prepare_data(start_datetime, end_datetime)
+
+    if df_hist is None or df_hist.empty:
+        st.warning("Nenhum dado encontrado para os filtros selecionados.")
+        st.stop()
     
-    level_options = df_hist['kp_level'].unique()
+    _, all_level_counts, _ = get_kp_aggregates(start_datetime, end_datetime)
+    level_options = list(all_level_counts)
     selected_levels = st.sidebar.multiselect(
         "Filtre por Nível de Atividade",
         options=level_options,
@@ -196,22 +221,23 @@ def main():
     )
 
     # --- Aplicar Filtros ---
-    filtered_df = df_hist[
-        (df_hist['time_tag'] >= start_datetime) &
-        (df_hist['time_tag'] <= end_datetime) &
-        (df_hist['kp_level'].isin(selected_levels))
-    ]
+    summary, level_counts, recent_df = get_kp_aggregates(start_datetime, end_datetime, tuple(selected_levels))
 
-    if filtered_df.empty:
+    if summary['total'] == 0:
         st.warning("Nenhum dado encontrado para os filtros selecionados.")
         st.stop()
 
+    if 'kp_level' in df_hist:
+        filtered_df = df_hist[df_hist['kp_level'].isin(selected_levels)]
+    else:
+        filtered_df = df_hist
+
     # --- Totalizadores (KPIs) ---
     st.subheader("Resumo do Período Selecionado")
-    avg_kp = filtered_df['estimated_kp'].mean()
-    max_kp = filtered_df['estimated_kp'].max()
-    storm_records = len(filtered_df[filtered_df['kp_index'] >= 5])
-    total_records = len(filtered_df)
+    avg_kp = summary['media']
+    max_kp = summary['maximo']
+    storm_records = summary['tempestades']
+    total_records = summary['total']
 
     kpi1, kpi2, kpi3, kpi4 = st.columns(4)
     kpi1.metric("Média Kp (Estimado)", f"{avg_kp:.2f}")
@@ -226,6 +252,8 @@ def main():
 
     with col1:
         st.subheader("Série Temporal do Índice Kp")
+        if resolution != 'bruto':
+            st.caption(f"Média por {resolution} (o filtro de nível não se aplica a esta série).")
         fig_line = go.Figure()
         fig_line.add_trace(go.Scatter(x=filtered_df['time_tag'], y=filtered_df['estimated_kp'], mode='lines', name='Histórico'))
         
@@ -238,8 +266,7 @@ def main():
 
     with col2:
         st.subheader("Distribuição do Nível de Atividade")
-        level_counts = filtered_df['kp_level'].value_counts()
-        fig_bar = px.bar(x=level_counts.index, y=level_counts.values, labels={'x': 'Nível de Atividade', 'y': 'Contagem'})
+        fig_bar = px.bar(x=list(level_counts.keys()), y=list(level_counts.values()), labels={'x': 'Nível de Atividade', 'y': 'Contagem'})
         fig_bar.update_layout(height=350, margin=dict(l=20, r=20, t=20, b=20))
         st.plotly_chart(fig_bar, use_container_width=True)
 
@@ -247,17 +274,13 @@ def main():
 
     with col3:
         st.subheader("Proporção de Atividade")
-        fig_pie = px.pie(filtered_df, names='kp_level', hole=0.4)
+        fig_pie = px.pie(names=list(level_counts.keys()), values=list(level_counts.values()), hole=0.4)
         fig_pie.update_layout(height=350, margin=dict(l=20, r=20, t=40, b=20), showlegend=False)
         st.plotly_chart(fig_pie, use_container_width=True)
         
     with col4:
         st.subheader("Top 10 Registros Mais Recentes")
         
-        # Obter os 10 registros mais recentes e reordenar para o gráfico
-        recent_df = filtered_df.sort_values(by='time_tag', ascending=False).head(10)
-        recent_df = recent_df.sort_values(by='time_tag', ascending=True)
-        
         # Formatar a hora para exibição no eixo Y
         recent_df['time_label'] = recent_df['time_tag'].dt.strftime('%d/%m %H:%M')
         